@@ -3,4 +3,9 @@ from django.db import models
 class Goal(models.TextChoices):
     GAIN_WEIGHT = 'G', 'Gain Weight'
     LOSE_WEIGHT = 'L', 'Lose Weight'
-    NUTRITION = 'N', 'Nutrition'
\ No newline at end of file
+    NUTRITION = 'N', 'Nutrition'
+
+
+class GenerationMode(models.TextChoices):
+    RANDOM = 'random', 'Random'
+    NUTRITION = 'nutrition', 'Nutrition target'
@@ -121,6 +121,32 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# The cached catalog pages, diet summaries and shopping lists are invalidated
+# by whichever worker handles a write, so every process must share the same
+# cache; a per-process backend such as the default LocMemCache would keep
+# serving stale data from the other workers. The table is created by the diets
+# migration 0021_create_cache_table.
+#
+# DatabaseCache counts its rows on every set and, past MAX_ENTRIES, drops the
+# expired rows and then 1/CULL_FREQUENCY of the others. The entries are two
+# per diet read in the last week (summary and shopping list, kept 7 days) and
+# one per catalog URL and version (kept a day, a few hundred at most), so
+# 50000 rows keep about 20000 weekly active diets warm with room for the
+# catalog, while the COUNT(*) stays a few milliseconds on PostgreSQL. Culling
+# a tenth at a time keeps a burst of sets from emptying the cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'nutrimate_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'CULL_FREQUENCY': 10,
+        },
+    }
+}
+
 # Email configuration
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', '')
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
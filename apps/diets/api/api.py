@@ -1,24 +1,106 @@
-from rest_framework import generics
+from django.core.cache import cache
+from django.db import models
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.http import HttpResponse, HttpResponseNotModified
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
 
-from apps.diets.models import Diet, Tag, Recipe
+from apps.diets.catalog import catalog_version
+from apps.diets.models import Diet, Tag, Recipe, Meal, Tombstone, Ingredient, RecipeIngredient, NUTRIENT_KEYS, normalize_ingredient_name
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-from .serializers import DietSerializer, RecipeSerializer, TagSerializer
+from .pagination import RecipeCursorPagination
+from .serializers import DietSerializer, DietSlotSerializer, HouseholdDietSerializer, RatingSerializer, RecipeSerializer, TagSerializer, IngredientSerializer
 
 
-class TagListCreateAPIView(generics.ListCreateAPIView):
+def _id_list(value):
+    """Parse a comma separated list of ids, ignoring anything that is not a number."""
+    return [int(item) for item in (value or '').split(',') if item.strip().isdigit()]
+
+
+def _number(value):
+    """Parse a float query parameter, returning None when missing or invalid."""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _integer(value, default, low, high):
+    """Parse an integer query parameter clamped to [low, high], or default when missing or invalid."""
+    try:
+        return min(max(int(value), low), high)
+    except (TypeError, ValueError):
+        return default
+
+
+# Cached catalog pages are keyed by version, so they only need to expire to free memory
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class CatalogCacheMixin:
+    """Serve GET list responses of the catalog from pre-rendered bytes.
+
+    Pages are cached per catalog version and URL, so any write to tags, recipes
+    or Recipe.tags (see apps.diets.catalog.catalog_changed) makes every cached
+    page stale at once. The version is also sent as the ETag: a request whose
+    If-None-Match still matches gets a 304 after reading the version row,
+    without querying the catalog or the cache.
+    """
+
+    def list(self, request, *args, **kwargs):
+        etag = f'"catalog-{catalog_version()}"'
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        if request.accepted_renderer.format != 'json':
+            # The browsable API is rendered per request
+            return super().list(request, *args, **kwargs)
+
+        key = f'diets:catalog:{etag}:{request.build_absolute_uri()}'
+        body = cache.get(key)
+        if body is None:
+            data = super().list(request, *args, **kwargs).data
+            body = request.accepted_renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+            cache.set(key, body, CATALOG_CACHE_TIMEOUT)
+
+        response = HttpResponse(body, content_type=request.accepted_media_type)
+        response['ETag'] = etag
+        return response
+
+
+class TagListCreateAPIView(CatalogCacheMixin, generics.ListCreateAPIView):
     """List all tags or create a new tag.
 
     GET: List all tags.
     POST: Create a new tag or multiple tags.
 
+    GET responses carry an ETag and are served from cache until the catalog
+    changes; send it back in If-None-Match to get a 304 Not Modified.
+
+    Query parameters (POST):
+    - upsert: "true" updates the description of tags whose name already exists
+      instead of failing, and returns the ids of both new and existing tags
+
     Request body (POST): { "name": "...", "description": "..." }
     Response (GET): [ { "id": 1, "name": "...", "description": "..." }, ... ]
     Response (POST): { "id": 1, "name": "...", "description": "..." }
     """
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
-    
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['upsert'] = self.request.query_params.get('upsert', '').lower() in ('1', 'true')
+        return context
+
     def get_serializer(self, *args, **kwargs):
         """
         Si los datos son una lista, pasa many=True para habilitar la creación masiva
@@ -39,7 +121,7 @@ class TagDeleteAPIView(generics.DestroyAPIView):
     queryset = Tag.objects.all()
 
 
-class RecipeListCreateAPIView(generics.ListCreateAPIView):
+class RecipeListCreateAPIView(CatalogCacheMixin, generics.ListCreateAPIView):
     """List all recipes or create a new recipe.
 
     GET: List all recipes.
@@ -69,12 +151,75 @@ class RecipeListCreateAPIView(generics.ListCreateAPIView):
         }
     ]
 
-    Response (GET): List of recipe objects
+    Optional query parameters (GET):
+    - meal: Only recipes for this meal (B, L or D)
+    - goal: Only recipes for this goal (N, W or L)
+    - tags: Comma separated tag ids, recipes having any of them
+    - exclude_tags: Comma separated tag ids, recipes having none of them
+    - ingredients: Comma separated ingredient ids, recipes containing any of them
+    - exclude_ingredients: Comma separated ingredient ids, recipes containing none of them
+    - min_<nutrient>, max_<nutrient>: Bounds on calories, protein, carbs or fat
+      (e.g. max_calories=500); recipes without that nutrient are excluded
+    - ordering: "rating" lists the best rated recipes first (unrated ones last)
+    - page_size: Recipes per page (default 50, max 200)
+    - cursor: Opaque cursor taken from the "next" or "previous" links
+
+    GET responses carry an ETag and are served from cache until the catalog
+    changes; send it back in If-None-Match to get a 304 Not Modified. Ratings
+    do not change the catalog, so rating_count, rating_average and the
+    "rating" ordering of a cached page may lag until the next catalog write.
+
+    Response (GET): { "next": "<url or null>", "previous": "<url or null>", "results": [...] }
     Response (POST): Created recipe object(s)
     """
     permission_classes = [IsAdminUser]
     serializer_class = RecipeSerializer
-    queryset = Recipe.objects.all()
+    pagination_class = RecipeCursorPagination
+
+    def get_queryset(self):
+        # Tags are prefetched so a page costs the same number of queries at any size
+        recipes = Recipe.objects.prefetch_related('tags')
+        params = self.request.query_params
+
+        for field in ('meal', 'goal'):
+            if params.get(field):
+                recipes = recipes.filter(**{field: params[field]})
+
+        # Bounds on the typed nutrient columns, calories is indexed
+        for key in NUTRIENT_KEYS:
+            for bound, lookup in (('min', 'gte'), ('max', 'lte')):
+                value = _number(params.get(f'{bound}_{key}'))
+                if value is not None:
+                    recipes = recipes.filter(**{f'{key}__{lookup}': value})
+
+        tag_ids = _id_list(params.get('tags'))
+        if tag_ids:
+            # A subquery instead of a join, so recipes with several tags are not repeated
+            recipes = recipes.filter(
+                id__in=Recipe.tags.through.objects.filter(tag_id__in=tag_ids).values('recipe_id')
+            )
+        exclude_tag_ids = _id_list(params.get('exclude_tags'))
+        if exclude_tag_ids:
+            recipes = recipes.exclude(tags__in=exclude_tag_ids)
+
+        # Both served by the (ingredient, recipe) index of RecipeIngredient
+        ingredient_ids = _id_list(params.get('ingredients'))
+        if ingredient_ids:
+            recipes = recipes.filter(
+                id__in=RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids).values('recipe_id')
+            )
+        exclude_ingredient_ids = _id_list(params.get('exclude_ingredients'))
+        if exclude_ingredient_ids:
+            recipes = recipes.exclude(
+                id__in=RecipeIngredient.objects.filter(ingredient_id__in=exclude_ingredient_ids).values('recipe_id')
+            )
+
+        if params.get('ordering') == 'rating':
+            # Computed from the denormalized counters, no GROUP BY over the ratings
+            average = Cast('rating_sum', models.FloatField()) / NullIf('rating_count', 0)
+            recipes = recipes.annotate(avg_rating=Coalesce(average, 0.0))
+
+        return recipes
 
     def get_serializer(self, *args, **kwargs):
         """
@@ -85,6 +230,57 @@ class RecipeListCreateAPIView(generics.ListCreateAPIView):
         return super().get_serializer(*args, **kwargs)
 
 
+class RatingListCreateAPIView(generics.ListCreateAPIView):
+    """List or save the authenticated user's recipe ratings.
+
+    GET: The user's ratings, latest first.
+    POST: Rate one recipe or a burst of recipes at once; rating a recipe again
+    replaces its score. A list is saved as a single batch that updates the
+    rating counters of all its recipes together.
+
+    Request body (POST): { "recipe": recipe_id, "score": 1-5 } or a list of them
+    Response (POST): The saved rating(s)
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = RatingSerializer
+
+    def get_queryset(self):
+        return self.request.user.ratings.order_by('-updated_at', '-id')
+
+    def get_serializer(self, *args, **kwargs):
+        if isinstance(kwargs.get('data', {}), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class IngredientListAPIView(generics.ListAPIView):
+    """List the normalized ingredients found in the recipes.
+
+    Ingredients are created from Recipe.ingredients when recipes are saved or
+    imported; their ids are used by the recipe ingredient filters and by
+    User.excluded_ingredients.
+
+    Optional query parameters:
+    - search: Only ingredients whose name starts with this text
+
+    Response (GET): [ { "id": 1, "name": "arroz" }, ... ]
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = IngredientSerializer
+
+    def get_queryset(self):
+        ingredients = Ingredient.objects.order_by('name')
+        search = normalize_ingredient_name(self.request.query_params.get('search', ''))
+        if search:
+            # Names are stored normalized, so a case-sensitive prefix match on
+            # ingredient_name_prefix_idx is enough
+            ingredients = ingredients.filter(name__startswith=search)
+        return ingredients
+
+
 class RecipeDeleteAPIView(generics.DestroyAPIView):
     """API view to delete a recipe.
 
@@ -96,27 +292,260 @@ class RecipeDeleteAPIView(generics.DestroyAPIView):
     queryset = Recipe.objects.all()
 
 
+# Bounds of the "k" query parameter of the similar recipes endpoint
+SIMILAR_DEFAULT_K = 10
+SIMILAR_MAX_K = 100
+
+
+class RecipeSimilarAPIView(generics.GenericAPIView):
+    """Recommend recipes similar to a given one ("more like this").
+
+    GET: Rank the catalog by cosine similarity to the recipe, comparing its
+    tags, meal, goal and nutrients (see RecipeIndex.similar). Recipes with a tag
+    or ingredient excluded by the authenticated user are left out. Ranking runs
+    on the in-memory recipe index, only the returned recipes are queried.
+
+    Optional query parameters:
+    - k: Number of recipes to return (1-100, default 10)
+    - meal: Only recipes of these meals (comma separated codes, e.g. "B,L")
+
+    Response (GET): [ { "id": 2, "name": "...", ..., "similarity": 0.93 }, ... ]
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = RecipeSerializer
+
+    def get(self, request, pk, *args, **kwargs):
+        from apps.diets.catalog import recipe_index
+        from apps.diets.utils import user_preferences, NO_PREFERENCES
+
+        get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        params = request.query_params
+        k = _integer(params.get('k'), SIMILAR_DEFAULT_K, 1, SIMILAR_MAX_K)
+        meals = [meal for meal in params.get('meal', '').split(',') if meal in Meal.values]
+
+        tag_ids, ingredient_ids, _ = user_preferences([request.user.pk]).get(request.user.pk, NO_PREFERENCES)
+        ranked = recipe_index.similar([pk], k, meals, tag_ids, ingredient_ids)
+
+        recipes = Recipe.objects.prefetch_related('tags').in_bulk([recipe_id for recipe_id, _ in ranked])
+        return Response([
+            {**RecipeSerializer(recipes[recipe_id]).data, 'similarity': round(score, 4)}
+            for recipe_id, score in ranked
+            if recipe_id in recipes
+        ])
+
+
+# Sync cursors are microseconds since the epoch
+SYNC_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Rows written by transactions still in flight carry an earlier updated_at than
+# their commit, so the returned cursor stays this far behind the current time
+SYNC_SAFETY_WINDOW = timedelta(seconds=5)
+
+
+class CatalogChangesAPIView(generics.GenericAPIView):
+    """Incremental sync feed of the tag and recipe catalog.
+
+    GET: Return the tags and recipes created or updated since a cursor, and the
+    ids of those deleted since then. Without a cursor the whole catalog is
+    returned. Clients store the returned cursor and send it on the next sync.
+    Changes close to the cursor may be sent twice, so clients should apply them
+    as upserts by id.
+
+    Query parameters:
+    - since: Cursor returned by the previous call
+
+    Response (GET): {
+        "cursor": "<opaque cursor>",
+        "tags": [ { "id": 1, "name": "...", "description": "..." }, ... ],
+        "recipes": [ { "id": 1, "name": "...", ..., "tags": [...] }, ... ],
+        "deleted": { "tags": [tag_id, ...], "recipes": [recipe_id, ...] }
+    }
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = SYNC_EPOCH + timedelta(microseconds=int(since))
+            except (ValueError, OverflowError):
+                return Response({'detail': 'Cursor inválido'}, status=status.HTTP_400_BAD_REQUEST)
+
+        cursor = timezone.now() - SYNC_SAFETY_WINDOW
+        tags = Tag.objects.order_by('updated_at', 'id')
+        recipes = Recipe.objects.prefetch_related('tags').order_by('updated_at', 'id')
+        deleted = {Tombstone.TAG: [], Tombstone.RECIPE: []}
+        if since:
+            # Served by the updated_at and deleted_at indexes
+            tags = tags.filter(updated_at__gte=since)
+            recipes = recipes.filter(updated_at__gte=since)
+            tombstones = Tombstone.objects.filter(deleted_at__gte=since).order_by('deleted_at')
+            for kind, object_id in tombstones.values_list('kind', 'object_id'):
+                deleted[kind].append(object_id)
+
+        return Response({
+            'cursor': str((cursor - SYNC_EPOCH) // timedelta(microseconds=1)),
+            'tags': TagSerializer(tags, many=True).data,
+            'recipes': RecipeSerializer(recipes, many=True).data,
+            'deleted': {'tags': deleted[Tombstone.TAG], 'recipes': deleted[Tombstone.RECIPE]},
+        })
+
+
 class DietCreateAPIView(generics.CreateAPIView):
     """API view for Diet model.
 
     POST: Create a new diet. Requires being an authenticated user.
 
+    Optional body parameters:
+    - startDate: First day of the diet (YYYY-MM-DD), defaults to today
+    - mode: "random" (default) shuffles eligible recipes, "nutrition" picks the
+      recipes whose daily calories and macros best match the user's target
+    - weeks: Number of consecutive weekly diets to create (1-12, default 1). They
+      are generated in one transaction, spreading recipe variety over all the
+      weeks; the response is then a list of diets ordered by startDate
+
     Request body (POST): {"recipes": [recipe_id1, recipe_id2, ...] }
     Response (POST): { "id": 1, "startDate": "YYYY-MM-DD", "endDate": "YYYY-MM-DD", "recipes": [recipe_id1, recipe_id2, ...], "user": user_id }
     """
     permission_classes = [IsAuthenticated]
     serializer_class = DietSerializer
 
-    def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+
+        # Reload with the prefetch plan so the response does not query per menu
+        diets = Diet.objects.with_menus('tags').filter(pk__in=[diet.pk for diet in serializer.diets]).order_by('startDate')
+        if len(serializer.diets) == 1:
+            data = self.get_serializer(diets[0]).data
+        else:
+            data = self.get_serializer(diets, many=True).data
+        return Response(data, status=status.HTTP_201_CREATED)
     
     
+class HouseholdDietCreateAPIView(generics.GenericAPIView):
+    """Create linked diets with the same meals for every member of a household.
+
+    POST: Requires being an authenticated member of the household. The recipes
+    avoid the tags and ingredients excluded by any member and are picked once;
+    the goal filter only applies when all the members share the same goal.
+
+    Optional body parameters:
+    - startDate: First day of the diets (YYYY-MM-DD), defaults to today
+    - mode: "random" (default) or "nutrition", which aims at the average daily
+      target of the members
+    - weeks: Number of consecutive weeks to plan (1-12, default 1)
+
+    Response (POST): [ { "id": 1, "startDate": "YYYY-MM-DD", "endDate": "YYYY-MM-DD", "menus": [...] }, ... ]
+    one diet per member and week, ordered by startDate.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = HouseholdDietSerializer
+
+    def post(self, request, pk, *args, **kwargs):
+        from apps.users.models import Household, User
+
+        members = models.Prefetch('members', queryset=User.objects.select_related('ideal'))
+        household = get_object_or_404(Household.objects.prefetch_related(members), pk=pk, members=request.user)
+        serializer = self.get_serializer(
+            data=request.data, context={**self.get_serializer_context(), 'household': household}
+        )
+        serializer.is_valid(raise_exception=True)
+        created = serializer.save(household=household)
+
+        # Reload with the prefetch plan so the response does not query per menu
+        diets = (
+            Diet.objects.with_menus('tags')
+            .filter(pk__in=[diet.pk for diet in created])
+            .order_by('startDate', 'user_id')
+        )
+        return Response(DietSerializer(diets, many=True).data, status=status.HTTP_201_CREATED)
+
+
 class DietDeleteAPIView(generics.DestroyAPIView):
     """API view to delete a diet.
 
-    DELETE: Delete a diet by ID.
+    DELETE: Delete a diet by ID. Its menus and menu slots are deleted with it.
 
     Response (DELETE): 204 No Content
     """
     permission_classes = [IsAuthenticated]
     queryset = Diet.objects.all()
+
+
+class DietSlotAPIView(generics.GenericAPIView):
+    """Swap the recipe of one meal of one of the authenticated user's diets.
+
+    PATCH: Replace the recipe of a (day, meal) slot without regenerating the
+    week. Without "recipe", another eligible recipe is picked with the same
+    rules used to generate the diet, preferring recipes not already in the week.
+
+    Request body (PATCH): { "day": 1-7, "meal": "B|L|D", "recipe": recipe_id (optional) }
+    Response (PATCH): { "day": 1, "meal": "B", "recipe": { "id": 1, "name": "...", ... } }
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = DietSlotSerializer
+
+    def patch(self, request, pk, *args, **kwargs):
+        diet = get_object_or_404(Diet.objects.select_related('user__ideal'), pk=pk, user=request.user)
+        serializer = self.get_serializer(diet, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        data = serializer.validated_data
+        recipe = Recipe.objects.prefetch_related('tags').get(pk=data['recipe'])
+        return Response({'day': data['day'], 'meal': data['meal'], 'recipe': RecipeSerializer(recipe).data})
+
+
+class DietSummaryAPIView(generics.GenericAPIView):
+    """Calorie and macro totals of one of the authenticated user's diets.
+
+    GET: Return the calories, protein, carbs and fat of every day of the diet
+    and of the whole week. Totals come from one aggregate query and are cached
+    per diet until its menus or any of its recipes change.
+
+    Response (GET): {
+        "diet": 1,
+        "startDate": "YYYY-MM-DD",
+        "endDate": "YYYY-MM-DD",
+        "days": [
+            { "day": 1, "recipes": 3, "incomplete": 0, "calories": 1850.0, "protein": 95.0, "carbs": 210.0, "fat": 60.0 },
+            ...
+        ],
+        "week": { "recipes": 21, "incomplete": 0, "calories": 12950.0, ... }
+    }
+
+    "incomplete" counts the recipes without calorie information.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        from apps.diets.utils import cached_diet_nutrition_summary
+
+        diet = get_object_or_404(Diet, pk=pk, user=request.user)
+        return Response(cached_diet_nutrition_summary(diet))
+
+
+class DietShoppingListAPIView(generics.GenericAPIView):
+    """Consolidated shopping list of one of the authenticated user's diets.
+
+    GET: Return the ingredients of the whole week, with the quantities of
+    repeated ingredients summed. The list is cached per diet until its menus
+    or any of its recipes change.
+
+    Response (GET): {
+        "diet": 1,
+        "items": [
+            { "ingredient": 3, "name": "arroz", "quantity": 400.0, "unit": "g", "recipes": 2 },
+            { "ingredient": 7, "name": "sal", "quantity": null, "unit": "", "recipes": 5 },
+            ...
+        ]
+    }
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk, *args, **kwargs):
+        from apps.diets.utils import cached_diet_shopping_list
+
+        diet = get_object_or_404(Diet, pk=pk, user=request.user)
+        return Response(cached_diet_shopping_list(diet))
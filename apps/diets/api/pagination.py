@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DietCursorPagination(CursorPagination):
+    """Keyset pagination over diets, newest startDate first."""
+    ordering = ('-startDate', '-id')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over the recipe catalog, in insertion order.
+
+    With ?ordering=rating the best rated recipes come first, the view must then
+    annotate avg_rating.
+    """
+    ordering = ('id',)
+    orderings = {'rating': ('-avg_rating', '-id')}
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        return self.orderings.get(request.query_params.get('ordering'), self.ordering)
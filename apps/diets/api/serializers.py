@@ -1,27 +1,40 @@
+from django.db import transaction
+from datetime import timedelta
 from rest_framework import serializers
-from apps.diets.models import Tag, Recipe, Diet, Menu
+from apps.diets.models import Tag, Recipe, Diet, Menu, MenuRecipe, Meal, Ingredient, Rating
+from apps.diets.catalog import catalog_changed
+from Nutrimate.core.enums import GenerationMode
 
 
 class RecipeListSerializer(serializers.ListSerializer):
     def create(self, validated_data):
-        m2m_data = []
-        recipes = []
-        for item in validated_data:
-            tags = item.pop('tags', [])
-            recipes.append(Recipe(**item))
-            m2m_data.append(tags)
-        recipes = Recipe.objects.bulk_create(recipes)
-        
-        for recipe, tag in zip(recipes, m2m_data):
-            recipe.tags.set(tag)
-        return recipes
+        from apps.diets.utils import bulk_create_recipes
+
+        # Recipes and their tag rows are inserted with one query each
+        return bulk_create_recipes(validated_data)
 
 
 class TagListSerializer(serializers.ListSerializer):
     def create(self, validated_data):
-        # Create Tag instances in bulk for efficiency
-        tags = [Tag(**item) for item in validated_data]
-        return Tag.objects.bulk_create(tags)
+        if not self.context.get('upsert'):
+            # Create Tag instances in bulk for efficiency
+            tags = Tag.objects.bulk_create([Tag(**item) for item in validated_data])
+        else:
+            # One INSERT ... ON CONFLICT (name) DO UPDATE for the whole batch, which also
+            # sets the id of existing tags. A name repeated in the batch keeps its last row.
+            tags = {item['name']: Tag(**item) for item in validated_data}
+            tags = Tag.objects.bulk_create(
+                tags.values(),
+                update_conflicts=True,
+                unique_fields=['name'],
+                update_fields=['description', 'updated_at'],
+            )
+        # bulk_create does not send post_save. Bumped after the insert: outside a
+        # transaction on_commit runs at once, and a GET between a bump and the
+        # insert would cache the old list under the new version. Tags alone are
+        # not in the recipe index
+        catalog_changed(index_patched=True)
+        return tags
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -37,8 +50,27 @@ class TagSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id']
         list_serializer_class = TagListSerializer
+
+    def create(self, validated_data):
+        if self.context.get('upsert'):
+            tag, _ = Tag.objects.update_or_create(
+                name=validated_data['name'],
+                defaults={'description': validated_data.get('description', '')}
+            )
+            return tag
+        return super().create(validated_data)
         
         
+class IngredientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ingredient
+        fields = [
+            'id',
+            'name'
+        ]
+        read_only_fields = ['id', 'name']
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=True, max_length=100)
     description = serializers.CharField(required=True)
@@ -52,6 +84,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         required=True
     )
+    # Read from the denormalized counters, see apps.diets.utils.rate_recipes
+    rating_average = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -64,12 +98,73 @@ class RecipeSerializer(serializers.ModelSerializer):
             'nutritional_info',
             'meal',
             'goal',
-            'tags'
+            'tags',
+            'rating_count',
+            'rating_average'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['id', 'rating_count']
         list_serializer_class = RecipeListSerializer
 
 
+class RecipeImportSerializer(RecipeSerializer):
+    """Validates one row of a recipe import without querying the database.
+
+    Tags are plain ids checked against the set of known tag ids passed in the
+    serializer context as 'tag_ids'.
+    """
+    tags = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate_tags(self, value):
+        unknown = set(value) - self.context['tag_ids']
+        if unknown:
+            raise serializers.ValidationError(f'Etiquetas inexistentes: {sorted(unknown)}')
+        return value
+
+
+def check_recipes(recipe_ids, field='recipe'):
+    """Raise a ValidationError on field unless every recipe exists, with one query."""
+    missing = set(recipe_ids) - set(Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True))
+    if missing:
+        raise serializers.ValidationError(
+            {field: f"Recetas inexistentes: {', '.join(map(str, sorted(missing)))}"}
+        )
+
+
+class RatingListSerializer(serializers.ListSerializer):
+    def validate(self, data):
+        # The recipes of the whole batch are checked together
+        check_recipes([item['recipe_id'] for item in data])
+        return data
+
+    def create(self, validated_data):
+        from apps.diets.utils import rate_recipes
+
+        if validated_data:
+            # The whole burst updates the counters in one batch
+            rate_recipes(validated_data[0]['user'], {item['recipe_id']: item['score'] for item in validated_data})
+        return [Rating(**item) for item in validated_data]
+
+
+class RatingSerializer(serializers.Serializer):
+    """A user's score (1-5) for a recipe; rating a recipe again replaces the score."""
+    recipe = serializers.IntegerField(source='recipe_id')
+    score = serializers.IntegerField(min_value=1, max_value=5)
+
+    class Meta:
+        list_serializer_class = RatingListSerializer
+
+    def validate(self, data):
+        if self.parent is None:
+            check_recipes([data['recipe_id']])
+        return data
+
+    def create(self, validated_data):
+        from apps.diets.utils import rate_recipes
+
+        rate_recipes(validated_data['user'], {validated_data['recipe_id']: validated_data['score']})
+        return Rating(**validated_data)
+
+
 class MenuSerializer(serializers.ModelSerializer):
     day = serializers.IntegerField(required=False, min_value=1, max_value=7)
     recipes = serializers.PrimaryKeyRelatedField(
@@ -78,7 +173,7 @@ class MenuSerializer(serializers.ModelSerializer):
         required=False,
         write_only=True
     )
-    detailed_recipes = RecipeSerializer(many=True, read_only=True, source='recipes')
+    detailed_recipes = RecipeSerializer(many=True, read_only=True, source='ordered_recipes')
 
     class Meta:
         model = Menu
@@ -105,7 +200,7 @@ class RecipeDetailedSerializer(serializers.ModelSerializer):
 
 class MenuDetailedSerializer(serializers.ModelSerializer):
     """Minimal menu serializer showing day and recipes only"""
-    recipes = RecipeDetailedSerializer(many=True, read_only=True)
+    recipes = RecipeDetailedSerializer(many=True, read_only=True, source='ordered_recipes')
 
     class Meta:
         model = Menu
@@ -133,11 +228,19 @@ class DietSerializer(serializers.ModelSerializer):
     endDate = serializers.DateField(read_only=True)
     # Return fully-formed menus (day + recipe ids) instead of just PKs
     menus = MenuSerializer(many=True, read_only=True)
+    # How the week is generated: random shuffles or the nutrition target optimizer
+    mode = serializers.ChoiceField(
+        choices=GenerationMode.choices,
+        default=GenerationMode.RANDOM,
+        write_only=True
+    )
+    # Consecutive weekly diets generated at once, starting on startDate
+    weeks = serializers.IntegerField(default=1, min_value=1, max_value=12, write_only=True)
     
     def validate(self, data):
         """Validate that the user doesn't have an active diet in the requested date range."""
         from django.utils import timezone
-        from datetime import timedelta
+        from apps.diets.utils import diet_period, overlapping_diets
         
         user = self.context.get('request').user if self.context.get('request') else data.get('user')
         
@@ -147,15 +250,12 @@ class DietSerializer(serializers.ModelSerializer):
         else:
             start_date = timezone.now().date()
         
-        # Calculate end_date (one week later)
-        end_date = start_date + timedelta(days=7)
+        # Calculate end_date (one week later, or the end of the last requested week)
+        start_date, _ = diet_period(start_date)
+        _, end_date = diet_period(start_date + timedelta(weeks=data.get('weeks', 1) - 1))
         
         # Check if user has an active diet that overlaps with this date range
-        conflicting_diet = Diet.objects.filter(
-            user=user,
-            startDate__lte=end_date,
-            endDate__gte=start_date
-        ).exists()
+        conflicting_diet = overlapping_diets(start_date, end_date).filter(user=user).exists()
         
         if conflicting_diet:
             raise serializers.ValidationError(
@@ -166,98 +266,42 @@ class DietSerializer(serializers.ModelSerializer):
         return data
     
     def create(self, validated_data):
-        from datetime import timedelta
         from django.utils import timezone
-        import random
+        from apps.diets.utils import diet_period, user_preferences, generate_week_recipes, create_diets, NO_PREFERENCES
 
         user = validated_data['user']
+        mode = validated_data.get('mode', GenerationMode.RANDOM)
+        weeks = validated_data.get('weeks', 1)
 
         if 'startDate' not in validated_data:
             start_date = timezone.now().date()
         else:
             start_date = validated_data['startDate']
 
-        # Calculate endDate (one week later)
-        end_date = start_date + timedelta(days=7)
-
-        validated_data['endDate'] = end_date
-        validated_data['user'] = user
-       
-        user_goal = user.ideal.goal if user.ideal else None
-        
-        # exclude recipes that have at least one tag in common with the user
-        user_tags = user.tags.all()
-        eligible_qs = Recipe.objects.exclude(tags__in=user_tags).distinct()
-        
-        # Filter by user's goal if they have one
-        if user_goal:
-            eligible_qs = eligible_qs.filter(goal=user_goal)
-
-        # Separate recipes by meal type
-        breakfasts = list(eligible_qs.filter(meal='B'))
-        lunches = list(eligible_qs.filter(meal='L'))
-        dinners = list(eligible_qs.filter(meal='D'))
-
-        random.shuffle(breakfasts)
-        random.shuffle(lunches)
-        random.shuffle(dinners)
-
-        # Create backup lists for repetition if needed
-        breakfasts_backup = breakfasts.copy()
-        lunches_backup = lunches.copy()
-        dinners_backup = dinners.copy()
+        # Eligible recipes come from the in-memory index, only the user's
+        # excluded tags and ingredients and their favorites are queried, together
+        user_tag_ids, ingredient_ids, favorite_ids = user_preferences([user.pk]).get(user.pk, NO_PREFERENCES)
 
-        # Build list of 21 recipes (3 per day for 7 days)
+        # Build list of 21 recipes per week (3 per day for 7 days)
         # Each day has [breakfast, lunch, dinner] in fixed positions
-        result_recipes = []
-
-        for _ in range(7):
-            # Breakfast (index 0 of the day)
-            if breakfasts:
-                result_recipes.append(breakfasts.pop())
-            elif breakfasts_backup:
-                result_recipes.append(random.choice(breakfasts_backup))
-            else:
-                result_recipes.append(None)  # Leave empty if no breakfast available
-
-            # Lunch (index 1 of the day)
-            if lunches:
-                result_recipes.append(lunches.pop())
-            elif lunches_backup:
-                result_recipes.append(random.choice(lunches_backup))
-            else:
-                result_recipes.append(None)  # Leave empty if no lunch available
-
-            # Dinner (index 2 of the day)
-            if dinners:
-                result_recipes.append(dinners.pop())
-            elif dinners_backup:
-                result_recipes.append(random.choice(dinners_backup))
-            else:
-                result_recipes.append(None)  # Leave empty if no dinner available
-
-        # Create 7 Menu instances (one per day)
-        menu_instances = []
-        for day_idx in range(7):
-            day_recipes = result_recipes[day_idx*3:(day_idx+1)*3]
-            # Filter out None values to avoid errors when setting m2m relationships
-            day_recipes = [recipe for recipe in day_recipes if recipe is not None]
-            menu = Menu.objects.create(day=day_idx + 1)
-            # set m2m recipes for the menu
-            if day_recipes:  # Only set if there are recipes
-                menu.recipes.set(day_recipes)
-            menu_instances.append(menu)
-
-        # Remove menus from validated_data before creating Diet via super()
-        data_for_diet = dict(validated_data)
-        if 'menus' in data_for_diet:
-            data_for_diet.pop('menus')
-
-        # Create the Diet instancee, then attach menus
-        diet = super().create(data_for_diet)
-        diet.menus.set(menu_instances)
-
-        return diet
+        result_recipes = generate_week_recipes(user, user_tag_ids, mode, ingredient_ids, weeks, favorite_ids)
+
+        plans = []
+        for week in range(weeks):
+            # Calculate endDate (one week later), each week starts when the previous ends
+            week_start, end_date = diet_period(start_date + timedelta(weeks=week))
+            plans.append((
+                Diet(user=user, startDate=week_start, endDate=end_date),
+                result_recipes[week * 21:(week + 1) * 21],
+            ))
+
+        # Diets, menus and menu slots are written in bulk inside one transaction
+        with transaction.atomic():
+            create_diets(plans)
+
+        # A multi-week request returns its first diet, the view exposes all of them
+        self.diets = [diet for diet, _ in plans]
+        return self.diets[0]
     
     class Meta:
         model = Diet
@@ -265,6 +309,140 @@ class DietSerializer(serializers.ModelSerializer):
             'id',
             'startDate',
             'endDate',
-            'menus'
+            'menus',
+            'mode',
+            'weeks'
         ]
         read_only_fields = ['id', 'menus', 'startDate', 'endDate']
+
+
+class HouseholdDietSerializer(serializers.Serializer):
+    """Plan the same meals for every member of a household.
+
+    One shared set of recipes is picked for the union of the members'
+    exclusions, then a linked diet is written for each member in one transaction.
+    The household is read from the 'household' context key and passed again to
+    save(), its members should be prefetched with their ideal.
+    """
+    startDate = serializers.DateField(required=False)
+    mode = serializers.ChoiceField(choices=GenerationMode.choices, default=GenerationMode.RANDOM)
+    weeks = serializers.IntegerField(default=1, min_value=1, max_value=12)
+
+    def validate(self, data):
+        """Validate that no member has an active diet in the requested date range."""
+        from django.utils import timezone
+        from apps.diets.utils import diet_period, overlapping_diets
+
+        start_date, _ = diet_period(data.get('startDate') or timezone.now().date())
+        _, end_date = diet_period(start_date + timedelta(weeks=data['weeks'] - 1))
+        data['startDate'] = start_date
+
+        members = list(self.context['household'].members.all())
+        if not members:
+            raise serializers.ValidationError('El hogar no tiene miembros.')
+
+        # One query for all the members instead of one per member
+        busy = overlapping_diets(start_date, end_date).filter(user__in=members).values_list('user__email', flat=True)
+        if busy:
+            raise serializers.ValidationError(
+                'Algunos miembros ya tienen una dieta activa en este período: '
+                + ', '.join(sorted(set(busy)))
+            )
+        return data
+
+    def create(self, validated_data):
+        from apps.diets.utils import diet_period, user_preferences, generate_shared_recipes, create_diets
+
+        household = validated_data['household']
+        members = list(household.members.all())
+        weeks = validated_data['weeks']
+
+        # The preferences of every member are read with one query and the
+        # shared recipes are picked once for the whole household
+        preferences = user_preferences([member.pk for member in members])
+        result_recipes = generate_shared_recipes(members, preferences, validated_data['mode'], weeks)
+
+        plans = []
+        for week in range(weeks):
+            week_start, end_date = diet_period(validated_data['startDate'] + timedelta(weeks=week))
+            week_recipes = result_recipes[week * 21:(week + 1) * 21]
+            for member in members:
+                plans.append((
+                    Diet(user=member, household=household, startDate=week_start, endDate=end_date),
+                    week_recipes,
+                ))
+
+        # Every member's diets, menus and slots are written by the same bulk inserts
+        with transaction.atomic():
+            return create_diets(plans)
+
+
+class DietSlotSerializer(serializers.Serializer):
+    """Replace the recipe of one (day, meal) slot of a diet.
+
+    Without a recipe, another one is picked from the same eligible pool and with
+    the same rating, favorite and recent recipe weights as DietSerializer.create,
+    avoiding the recipes already in the week when possible.
+    """
+    day = serializers.IntegerField(min_value=1, max_value=7)
+    meal = serializers.ChoiceField(choices=Meal.choices)
+    recipe = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        from apps.diets.utils import (
+            MEAL_ORDER, NO_PREFERENCES, user_preferences, weighted_pools, recent_recipe_ids, _shuffled
+        )
+
+        diet = self.instance
+        user = diet.user
+        user_tag_ids, ingredient_ids, favorite_ids = user_preferences([user.pk]).get(user.pk, NO_PREFERENCES)
+        goal = user.ideal.goal if user.ideal else None
+        pools, weights = weighted_pools([data['meal']], user_tag_ids, goal, ingredient_ids, favorite_ids)
+        pool, pool_weights = pools[data['meal']], weights[data['meal']]
+
+        # The whole week in one query, to find the slot and avoid repeats
+        week = {
+            (day, slot): (row_id, recipe_id)
+            for row_id, day, slot, recipe_id in MenuRecipe.objects.filter(menu__diet=diet)
+            .values_list('id', 'menu__day', 'slot', 'recipe_id')
+        }
+        data['slot'] = MEAL_ORDER.index(data['meal'])
+        data['row_id'], current = week.get((data['day'], data['slot']), (None, None))
+        if data['row_id'] is None:
+            # The slot was left empty when the diet was generated, its menu may
+            # also be missing from diets migrated from the old schema
+            data['menu_id'] = Menu.objects.filter(diet=diet, day=data['day']).values_list('pk', flat=True).first()
+            if data['menu_id'] is None:
+                raise serializers.ValidationError({'day': 'La dieta no tiene menú para este día.'})
+
+        if 'recipe' in data:
+            if data['recipe'] not in set(pool):
+                raise serializers.ValidationError({'recipe': 'La receta no es elegible para esta comida.'})
+            return data
+
+        in_week = {recipe_id for _, recipe_id in week.values()}
+        keep = [recipe_id not in in_week for recipe_id in pool]
+        if not any(keep):
+            keep = [recipe_id != current for recipe_id in pool]
+        if not any(keep):
+            raise serializers.ValidationError('No hay otra receta elegible para esta comida.')
+        candidates = [recipe_id for recipe_id, kept in zip(pool, keep) if kept]
+        # Recent recipes come last unless they are favorites, as in DietSerializer.create
+        recent = recent_recipe_ids(user) - set(favorite_ids)
+        data['recipe'] = _shuffled(candidates, recent, pool_weights[keep])[-1]
+        return data
+
+    def update(self, diet, validated_data):
+        from apps.diets.utils import invalidate_diet_caches
+
+        recipe_id = validated_data['recipe']
+        if validated_data['row_id'] is not None:
+            # Only the affected menu slot is written
+            MenuRecipe.objects.filter(pk=validated_data['row_id']).update(recipe_id=recipe_id)
+        else:
+            MenuRecipe.objects.create(
+                menu_id=validated_data['menu_id'], slot=validated_data['slot'], recipe_id=recipe_id
+            )
+
+        invalidate_diet_caches([diet.pk])
+        return diet
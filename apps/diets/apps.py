@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class DietsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.diets"
+
+    def ready(self):
+        # Register signal handlers that keep the recipe index in sync
+        from apps.diets import signals  # noqa: F401
+        # Warn when the cache is not shared by every worker
+        from apps.diets import checks  # noqa: F401
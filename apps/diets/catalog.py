@@ -0,0 +1,472 @@
+from django.db import transaction
+from django.db.models import F
+from apps.diets.models import CatalogVersion, Recipe, RecipeIngredient, Meal, NUTRIENT_KEYS, parse_nutrients
+from Nutrimate.core.enums import Goal
+import numpy as np
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Set bits of every byte value, to count the ids of packed rows
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+# Typical nutrients of one meal (kcal and grams, in NUTRIENT_KEYS order). Dividing
+# by them keeps every nutrient around 1 in the similarity features, so none
+# outweighs a shared tag, and they are fixed so single rows can be updated
+NUTRIENT_SCALE = np.array([600, 30, 75, 20], dtype=np.float32)
+
+
+# Ratings are smoothed towards a neutral score, so one early 5 does not make a
+# recipe the favourite of everyone: weight = (sum + MEAN * COUNT) / (count + COUNT)
+RATING_PRIOR_MEAN = 3
+RATING_PRIOR_COUNT = 2
+
+
+def _feature_rows(meals, goals, nutrients):
+    """Dense similarity features: one-hot meal, one-hot goal and scaled nutrients."""
+    return np.hstack([
+        (meals[:, None] == np.array(Meal.values)).astype(np.float32),
+        (goals[:, None] == np.array(Goal.values)).astype(np.float32),
+        nutrients / NUTRIENT_SCALE,
+    ])
+
+
+class _PackedSets:
+    """A set of ids per recipe row, stored as a packed NumPy bit matrix.
+
+    Every known id owns one bit (one matrix column), so testing whether rows
+    contain any id of a given set is a single vectorized AND + any().
+    """
+
+    def __init__(self, rows=0):
+        self.matrix = np.zeros((rows, 0), dtype=np.uint8)
+        self.counts = np.zeros(rows, dtype=np.float32)  # number of ids of every row
+        self.bits = {}  # {id: bit position}
+
+    @classmethod
+    def from_pairs(cls, row_ids, pairs):
+        """Build the matrix from (row id, member id) pairs; row_ids must be sorted."""
+        sets = cls()
+        # Ids come back sorted, so rows are found with a binary search
+        pairs = pairs[np.isin(pairs[:, 0], row_ids)]
+        member_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+        dense = np.zeros((len(row_ids), len(member_ids)), dtype=bool)
+        dense[np.searchsorted(row_ids, pairs[:, 0]), columns] = True
+
+        sets.matrix = np.packbits(dense, axis=1)
+        sets.counts = dense.sum(axis=1, dtype=np.float32)
+        sets.bits = {member_id: bit for bit, member_id in enumerate(member_ids.tolist())}
+        return sets
+
+    def add_row(self):
+        self.matrix = np.vstack([self.matrix, np.zeros((1, self.matrix.shape[1]), dtype=np.uint8)])
+        self.counts = np.append(self.counts, np.float32(0))
+
+    def _bit(self, member_id):
+        """Return the bit of an id, adding a matrix column for unseen ids."""
+        if member_id not in self.bits:
+            self.bits[member_id] = len(self.bits)
+            width = (len(self.bits) + 7) // 8
+            if width > self.matrix.shape[1]:
+                self.matrix = np.pad(self.matrix, ((0, 0), (0, width - self.matrix.shape[1])))
+        return self.bits[member_id]
+
+    def add(self, row, member_ids):
+        for member_id in member_ids:
+            bit = self._bit(member_id)
+            self.matrix[row, bit // 8] |= 0x80 >> (bit % 8)
+        self._count(row)
+
+    def remove(self, row, member_ids=None):
+        """Clear the given ids from a row, or all of them if member_ids is None."""
+        if member_ids is None:
+            self.matrix[row] = 0
+        for member_id in member_ids or ():
+            if member_id in self.bits:
+                bit = self.bits[member_id]
+                self.matrix[row, bit // 8] &= ~np.uint8(0x80 >> (bit % 8))
+        self._count(row)
+
+    def _count(self, row):
+        self.counts[row] = _POPCOUNT[self.matrix[row]].sum()
+
+    def any_of(self, member_ids):
+        """Boolean mask of the rows containing any of the given ids, or None if none can."""
+        bits = [self.bits[member_id] for member_id in member_ids if member_id in self.bits]
+        if not bits:
+            return None
+        query = np.zeros(self.matrix.shape[1] * 8, dtype=bool)
+        query[bits] = True
+        # Only the bytes holding a queried bit are compared
+        columns = np.unique(np.array(bits) // 8)
+        return np.bitwise_and(self.matrix[:, columns], np.packbits(query)[columns]).any(axis=1)
+
+    def overlap(self, row):
+        """Number of ids every row shares with the given row.
+
+        Only the bytes where the row has bits are compared, so the cost grows
+        with the ids of that row rather than with every known id.
+        """
+        columns = np.flatnonzero(self.matrix[row])
+        if not len(columns):
+            return np.zeros(len(self.matrix), dtype=np.float32)
+        shared = np.bitwise_and(self.matrix[:, columns], self.matrix[row, columns])
+        return _POPCOUNT[shared].sum(axis=1, dtype=np.float32)
+
+    @property
+    def size(self):
+        return len(self.bits)
+
+
+class RecipeIndex:
+    """Process-local index of the recipe catalog used by diet generation.
+
+    Every recipe owns one row holding its id, goal, meal and nutrients. Its tags
+    and its normalized ingredients are stored as packed NumPy bit matrices
+    (recipes x tags and recipes x ingredients, one bit per known id), which act
+    as inverted indexes: excluding the recipes that share a tag or an ingredient
+    with a user is a single vectorized AND + any() over each matrix, so once the
+    index is warm diet generation does not query the catalog.
+
+    The same rows back the "more like this" recommendations: every recipe has a
+    feature vector made of its tag bits, a one-hot meal and goal and its scaled
+    nutrients, and similar() ranks the catalog by cosine similarity to it.
+
+    The index is built lazily on first use. Each process holds its own copy:
+    the signal handlers in apps.diets.signals patch the copy of the process
+    making a write, which then follows the version its own bump produced (see
+    catalog_changed). Every read compares that version with the shared one,
+    so only writes made by other processes trigger a rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = False
+        self._version = None  # catalog version the index was built with
+        self._reset()
+
+    def _reset(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._goals = np.empty(0, dtype='<U1')
+        self._meals = np.empty(0, dtype='<U1')
+        self._alive = np.empty(0, dtype=bool)
+        self._nutrients = np.zeros((0, len(NUTRIENT_KEYS)), dtype=np.float32)
+        self._ratings = np.zeros((0, 2), dtype=np.float32)  # rating_count, rating_sum
+        self._features = _feature_rows(self._meals, self._goals, self._nutrients)
+        self._tags = _PackedSets()
+        self._ingredients = _PackedSets()
+        self._norms = np.ones(0, dtype=np.float32)  # length of every feature vector, tags included
+        self._rows = {}  # {recipe_id: row}
+
+    @staticmethod
+    def _pairs(queryset, *fields):
+        return np.array(list(queryset.values_list(*fields)), dtype=np.int64).reshape(-1, 2)
+
+    def _build(self):
+        self._reset()
+        # Read before the catalog, so a write committed meanwhile moves the
+        # version past this one and triggers another rebuild
+        self._version = catalog_version()
+        recipes = list(Recipe.objects.order_by('id').values_list(
+            'id', 'goal', 'meal', 'rating_count', 'rating_sum', *NUTRIENT_KEYS
+        ))
+
+        self._ids = np.array([r[0] for r in recipes], dtype=np.int64)
+        self._goals = np.array([r[1] for r in recipes], dtype='<U1')
+        self._meals = np.array([r[2] for r in recipes], dtype='<U1')
+        self._alive = np.ones(len(recipes), dtype=bool)
+        # The typed nutrient columns spare parsing every nutritional_info
+        self._nutrients = np.array(
+            [[value or 0.0 for value in r[5:]] for r in recipes], dtype=np.float32
+        ).reshape(-1, len(NUTRIENT_KEYS))
+        self._ratings = np.array([r[3:5] for r in recipes], dtype=np.float32).reshape(-1, 2)
+        self._features = _feature_rows(self._meals, self._goals, self._nutrients)
+        self._rows = {recipe_id: row for row, recipe_id in enumerate(self._ids.tolist())}
+
+        self._tags = _PackedSets.from_pairs(
+            self._ids, self._pairs(Recipe.tags.through.objects, 'recipe_id', 'tag_id')
+        )
+        self._ingredients = _PackedSets.from_pairs(
+            self._ids, self._pairs(RecipeIngredient.objects, 'recipe_id', 'ingredient_id')
+        )
+        self._norms = self._norms_of(slice(None))
+        self._built = True
+        logger.debug(
+            'RecipeIndex built with %d recipes, %d tags and %d ingredients',
+            len(self._ids), self._tags.size, self._ingredients.size,
+        )
+
+    @staticmethod
+    def _nutrient_rows(nutritional_infos):
+        # Missing nutrients count as 0 so they never break a vectorized sum
+        rows = [[value or 0.0 for value in parse_nutrients(info)] for info in nutritional_infos]
+        return np.array(rows, dtype=np.float32).reshape(-1, len(NUTRIENT_KEYS))
+
+    def _norms_of(self, rows):
+        # Each tag of a row is one more feature set to 1
+        features = self._features[rows]
+        norms = np.sqrt(np.einsum('ij,ij->i', features, features) + self._tags.counts[rows])
+        norms[norms == 0] = 1
+        return norms
+
+    def _refresh_norm(self, row):
+        self._norms[row] = self._norms_of(slice(row, row + 1))[0]
+
+    def invalidate(self):
+        """Drop the index so it is rebuilt from the database on next use."""
+        with self._lock:
+            self._built = False
+
+    def follow(self, version):
+        """Adopt a catalog version bumped by a write already patched into the index.
+
+        Only the version right after the current one is adopted; a gap means
+        another process wrote meanwhile, and the next read rebuilds.
+        """
+        with self._lock:
+            if self._built and self._version == version - 1:
+                self._version = version
+
+    def _eligible(self, tag_ids, goal, ingredient_ids=()):
+        """Boolean mask of the rows a user can eat. Must be called with the lock held."""
+        if not self._built or self._version != catalog_version():
+            self._build()
+
+        eligible = self._alive.copy()
+        if goal:
+            eligible &= self._goals == goal
+
+        # One reduction over the whole catalog per matrix: does any user bit match?
+        for sets, excluded in ((self._tags, tag_ids), (self._ingredients, ingredient_ids)):
+            matches = sets.any_of(excluded)
+            if matches is not None:
+                eligible &= ~matches
+        return eligible
+
+    def eligible_pools(self, meals, tag_ids, goal=None, ingredient_ids=()):
+        """Return the recipe ids a user can eat, grouped by meal.
+
+        Args:
+            meals: Meal codes to return pools for.
+            tag_ids: Ids of the tags the user wants to avoid.
+            goal (str): Optional goal code; when None every goal is eligible.
+            ingredient_ids: Ids of the ingredients the user wants to avoid.
+
+        Returns:
+            A dict {meal: [recipe_id, ...]} with an entry for every meal.
+        """
+        with self._lock:
+            eligible = self._eligible(tag_ids, goal, ingredient_ids)
+            return {
+                meal: self._ids[np.flatnonzero(eligible & (self._meals == meal))].tolist()
+                for meal in meals
+            }
+
+    def eligible_nutrients(self, meals, tag_ids, goal=None, ingredient_ids=()):
+        """Like eligible_pools, but returns NumPy arrays with the nutrients of each recipe.
+
+        Returns:
+            A dict {meal: (ids, nutrients)} where ids has shape (n,) and nutrients
+            has shape (n, len(NUTRIENT_KEYS)).
+        """
+        with self._lock:
+            eligible = self._eligible(tag_ids, goal, ingredient_ids)
+            pools = {}
+            for meal in meals:
+                rows = np.flatnonzero(eligible & (self._meals == meal))
+                pools[meal] = (self._ids[rows], self._nutrients[rows])
+            return pools
+
+    def similar(self, recipe_ids, k=10, meals=None, tag_ids=(), ingredient_ids=()):
+        """Return the recipes most similar to the given ones.
+
+        Recipes are compared by the cosine similarity of their feature vectors;
+        with several seed recipes the similarities to each of them are averaged.
+        Dense features are one matrix-vector product and the shared tags are
+        counted on the packed matrix, so no tag matrix is ever unpacked. The
+        norms of the vectors are stored with the rows and updated with them.
+
+        Args:
+            recipe_ids: Ids of the seed recipes; unknown ids are ignored.
+            k (int): Maximum number of recipes to return.
+            meals: Optional meal codes the results must belong to.
+            tag_ids: Ids of tags the results must not have.
+            ingredient_ids: Ids of ingredients the results must not contain.
+
+        Returns:
+            A list of (recipe_id, similarity) pairs, most similar first. The seed
+            recipes themselves are never returned.
+        """
+        with self._lock:
+            eligible = self._eligible(tag_ids, None, ingredient_ids)
+            seeds = [self._rows[recipe_id] for recipe_id in recipe_ids if recipe_id in self._rows]
+            if not seeds:
+                return []
+
+            norms = self._norms
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            for row in seeds:
+                dots = self._features @ self._features[row] + self._tags.overlap(row)
+                scores += dots / (norms * norms[row])
+            scores /= len(seeds)
+
+            if meals:
+                eligible &= np.isin(self._meals, list(meals))
+            eligible[seeds] = False
+            rows = np.flatnonzero(eligible)
+            # Only the k best rows are sorted
+            if len(rows) > k:
+                rows = rows[np.argpartition(-scores[rows], k)[:k]]
+            rows = rows[np.argsort(-scores[rows], kind='stable')]
+            return list(zip(self._ids[rows].tolist(), scores[rows].tolist()))
+
+    def eligible_ratings(self, meals, tag_ids, goal=None, ingredient_ids=()):
+        """Like eligible_pools, but returns NumPy arrays with the rating weight of each recipe.
+
+        Weights are the average scores smoothed with RATING_PRIOR_MEAN and
+        RATING_PRIOR_COUNT, so unrated recipes weigh RATING_PRIOR_MEAN.
+
+        Returns:
+            A dict {meal: (ids, weights)} of two arrays of shape (n,).
+        """
+        with self._lock:
+            eligible = self._eligible(tag_ids, goal, ingredient_ids)
+            counts, sums = self._ratings[:, 0], self._ratings[:, 1]
+            weights = (sums + RATING_PRIOR_MEAN * RATING_PRIOR_COUNT) / (counts + RATING_PRIOR_COUNT)
+            pools = {}
+            for meal in meals:
+                rows = np.flatnonzero(eligible & (self._meals == meal))
+                pools[meal] = (self._ids[rows], weights[rows])
+            return pools
+
+    # ---------- Incremental updates (called from signal handlers) ----------
+
+    def save_recipe(self, recipe_id, goal, meal, nutritional_info=None):
+        """Insert a recipe or update its goal, meal and nutrients."""
+        with self._lock:
+            if not self._built:
+                return
+            nutrients = self._nutrient_rows([nutritional_info])
+            if recipe_id in self._rows:
+                row = self._rows[recipe_id]
+                self._goals[row] = goal
+                self._meals[row] = meal
+                self._nutrients[row] = nutrients[0]
+                self._features[row] = _feature_rows(self._meals[row:row + 1], self._goals[row:row + 1], nutrients)[0]
+                self._refresh_norm(row)
+                return
+            self._rows[recipe_id] = len(self._ids)
+            self._ids = np.append(self._ids, recipe_id)
+            self._goals = np.append(self._goals, np.array([goal], dtype='<U1'))
+            self._meals = np.append(self._meals, np.array([meal], dtype='<U1'))
+            self._alive = np.append(self._alive, True)
+            self._nutrients = np.vstack([self._nutrients, nutrients])
+            self._features = np.vstack([self._features, _feature_rows(self._meals[-1:], self._goals[-1:], nutrients)])
+            self._ratings = np.vstack([self._ratings, np.zeros((1, 2), dtype=np.float32)])
+            self._tags.add_row()
+            self._ingredients.add_row()
+            self._norms = np.append(self._norms, self._norms_of(slice(-1, None)))
+
+    def delete_recipe(self, recipe_id):
+        """Hide a recipe; its row is dropped on the next rebuild."""
+        with self._lock:
+            if not self._built or recipe_id not in self._rows:
+                return
+            self._alive[self._rows.pop(recipe_id)] = False
+
+    def add_tags(self, recipe_id, tag_ids):
+        with self._lock:
+            if not self._built:
+                return
+            if recipe_id not in self._rows:
+                # Recipe created without signals (e.g. bulk_create), rebuild lazily
+                self._built = False
+                return
+            row = self._rows[recipe_id]
+            self._tags.add(row, tag_ids)
+            self._refresh_norm(row)
+
+    def remove_tags(self, recipe_id, tag_ids=None):
+        """Clear the given tags from a recipe, or all of them if tag_ids is None."""
+        with self._lock:
+            if not self._built or recipe_id not in self._rows:
+                return
+            row = self._rows[recipe_id]
+            self._tags.remove(row, tag_ids)
+            self._refresh_norm(row)
+
+    def set_ingredients(self, recipe_id, ingredient_ids):
+        """Replace the ingredients of a recipe."""
+        with self._lock:
+            if not self._built:
+                return
+            if recipe_id not in self._rows:
+                self._built = False
+                return
+            row = self._rows[recipe_id]
+            self._ingredients.remove(row)
+            self._ingredients.add(row, ingredient_ids)
+
+    def add_ratings(self, deltas):
+        """Apply rating counter deltas, {recipe_id: (count delta, sum delta)}."""
+        with self._lock:
+            if not self._built:
+                return
+            for recipe_id, delta in deltas.items():
+                if recipe_id in self._rows:
+                    self._ratings[self._rows[recipe_id]] += delta
+
+
+recipe_index = RecipeIndex()
+
+
+# ---------- Catalog version ----------
+
+CATALOG_VERSION_PK = 1
+
+
+def catalog_version():
+    """Return the version of the tag and recipe catalog.
+
+    The counter is the CatalogVersion row, one primary key read shared by
+    every process. It starts from the clock, so a recreated row never reuses
+    a version that may still key old cached responses.
+    """
+    version = CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).values_list('version', flat=True).first()
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_PK, defaults={'version': time.time_ns()}
+        )[0].version
+    return version
+
+
+def bump_catalog_version():
+    """Increment the catalog version and return the new value."""
+    with transaction.atomic():
+        # The row stays locked by the UPDATE, so the read returns this bump
+        if not CatalogVersion.objects.filter(pk=CATALOG_VERSION_PK).update(version=F('version') + 1):
+            catalog_version()
+            return bump_catalog_version()
+        return catalog_version()
+
+
+def catalog_changed(index_patched=False):
+    """Bump the catalog version once the current transaction commits.
+
+    Must be called by every write to tags, recipes or Recipe.tags, including the
+    bulk paths that do not send model signals.
+
+    Args:
+        index_patched (bool): Whether the write leaves recipe_index up to date,
+            because the caller registered its patch on commit before this call
+            or the write does not touch the index. The index of this process
+            then keeps the new version instead of being rebuilt.
+    """
+    def bump():
+        version = bump_catalog_version()
+        if index_patched:
+            recipe_index.follow(version)
+
+    transaction.on_commit(bump)
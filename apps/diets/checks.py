@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+# Backends whose entries live in a single process
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the default cache is not shared by every process.
+
+    The cached catalog pages, diet summaries and shopping lists are
+    invalidated by the worker handling a write; with a per-process cache the
+    other workers keep serving stale entries until they expire.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            f'The default cache ({backend}) is not shared between processes.',
+            hint='Use a shared backend such as DatabaseCache or Redis in settings.CACHES.',
+            id='diets.W001',
+        )]
+    return []
@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from apps.diets.models import Recipe, Tag
+from apps.diets.catalog import RecipeIndex
+from apps.diets.optimizer import optimize_week
+from apps.diets.utils import MEAL_ORDER
+from Nutrimate.core.enums import Goal
+import numpy as np
+import random
+import time
+
+# Daily target (kcal, protein, carbs, fat) of an average adult for the optimizer runs
+DAILY_TARGET = np.array([2200, 110, 275, 73], dtype=np.float32)
+
+
+class Rollback(Exception):
+    """Raised to discard the synthetic catalog once the benchmark is done."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the ORM tag-exclusion query with the NumPy recipe index on synthetic '
+        'catalogs, and time the weekly menu optimizer and the similar recipes ranking on '
+        'the same catalogs. Rows are created inside a transaction that is always rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--tags', type=int, default=60, help='Number of synthetic tags')
+        parser.add_argument('--user-tags', type=int, default=3, help='Tags excluded by the user')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs averaged per measure')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'recipes':>8} {'orm (ms)':>10} {'build (ms)':>11} {'index (ms)':>11} {'speedup':>8} "
+            f"{'optimize (ms)':>14} {'similar (ms)':>13}"
+        )
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self._run(size, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def _run(self, size, options):
+        prefix = f'bench-{time.time_ns()}'
+        tags = Tag.objects.bulk_create([
+            Tag(name=f'{prefix}-{i}'[:50]) for i in range(options['tags'])
+        ])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                name=f'bench {i}', description='', preparation_steps='',
+                meal=random.choice(MEAL_ORDER), goal=random.choice(Goal.values),
+                calories=random.uniform(100, 1200), protein=random.uniform(5, 60),
+                carbs=random.uniform(10, 150), fat=random.uniform(2, 50),
+            )
+            for i in range(size)
+        ], batch_size=5000)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+            for recipe in recipes
+            for tag in random.sample(tags, random.randint(0, 3))
+        ], batch_size=5000)
+
+        user_tag_ids = [tag.pk for tag in random.sample(tags, options['user_tags'])]
+        goal = Goal.NUTRITION
+
+        def orm_path():
+            # Same query DietSerializer.create ran before the index existed
+            eligible_qs = Recipe.objects.exclude(tags__in=user_tag_ids).distinct().filter(goal=goal)
+            return {meal: list(eligible_qs.filter(meal=meal).values_list('id', flat=True)) for meal in MEAL_ORDER}
+
+        index = RecipeIndex()
+        start = time.perf_counter()
+        index.eligible_pools(MEAL_ORDER, user_tag_ids, goal)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        orm_ms = self._timeit(orm_path, options['repeat'])
+        index_ms = self._timeit(lambda: index.eligible_pools(MEAL_ORDER, user_tag_ids, goal), options['repeat'])
+
+        # Both paths must agree before their timings mean anything
+        expected = {meal: sorted(ids) for meal, ids in orm_path().items()}
+        got = {meal: sorted(ids) for meal, ids in index.eligible_pools(MEAL_ORDER, user_tag_ids, goal).items()}
+        if expected != got:
+            self.stderr.write(self.style.ERROR(f'Index and ORM results differ for {size} recipes'))
+
+        pools = index.eligible_nutrients(MEAL_ORDER, user_tag_ids, goal)
+        rng = np.random.default_rng(0)
+        optimize_ms = self._timeit(lambda: optimize_week(pools, DAILY_TARGET, rng), options['repeat'])
+        similar_ms = self._timeit(
+            lambda: index.similar([random.choice(recipes).pk], 10, tag_ids=user_tag_ids), options['repeat']
+        )
+
+        self.stdout.write(
+            f'{size:>8} {orm_ms:>10.2f} {build_ms:>11.2f} {index_ms:>11.2f} {orm_ms / index_ms:>7.1f}x '
+            f'{optimize_ms:>14.2f} {similar_ms:>13.2f}'
+        )
+
+    def _timeit(self, func, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) * 1000 / repeat
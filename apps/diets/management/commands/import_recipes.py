@@ -0,0 +1,127 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.diets.api.serializers import RecipeImportSerializer
+from apps.diets.models import Tag
+from apps.diets.utils import bulk_create_recipes
+from itertools import islice
+import json
+import csv
+import os
+
+
+# Columns holding JSON text in a CSV import
+CSV_JSON_COLUMNS = ('ingredients', 'nutritional_info')
+
+
+def _parse_tags(value):
+    """Parse the tags column of a CSV row: a JSON list or ids separated by '|' or ','."""
+    value = (value or '').strip()
+    if value.startswith('['):
+        return json.loads(value)
+    return [tag.strip() for tag in value.replace('|', ',').split(',') if tag.strip()]
+
+
+def read_ndjson(f):
+    """Yield (line number, row) pairs, one JSON object per line.
+
+    Rows that cannot be parsed are yielded as a ValueError so they are
+    reported like any other invalid row.
+    """
+    for line_number, line in enumerate(f, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = ValueError(f'JSON inválido: {e}')
+        if not isinstance(row, (dict, ValueError)):
+            row = ValueError('Cada línea debe ser un objeto JSON')
+        yield line_number, row
+
+
+def read_csv(f):
+    """Yield (line number, row) pairs from a CSV file with a header row.
+
+    The ingredients and nutritional_info columns hold JSON text.
+    """
+    reader = csv.DictReader(f)
+    for row in reader:
+        try:
+            for column in CSV_JSON_COLUMNS:
+                if row.get(column):
+                    row[column] = json.loads(row[column])
+            row['tags'] = _parse_tags(row.get('tags'))
+        except ValueError as e:
+            row = ValueError(f'JSON inválido: {e}')
+        yield reader.line_num, row
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Import recipes from an NDJSON or CSV file. The file is streamed and validated '
+        'in chunks; each chunk inserts its recipes and their Recipe.tags rows with one '
+        'bulk_create each. Invalid rows are reported and skipped without aborting the import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' reads stdin")
+        parser.add_argument(
+            '--format', choices=READERS, dest='file_format',
+            help='Input format, guessed from the file extension by default'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows validated and inserted per transaction')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        path = options['path']
+        file_format = options['file_format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Unknown format {file_format!r}, use --format ndjson or --format csv')
+
+        # Tags are validated against ids loaded once instead of one query per row
+        context = {'tag_ids': set(Tag.objects.values_list('id', flat=True))}
+
+        imported = failed = 0
+        with self._open(path) as f:
+            rows = READERS[file_format](f)
+            while chunk := list(islice(rows, options['chunk_size'])):
+                valid = []
+                for line_number, row in chunk:
+                    errors = self._validate(row, context, valid)
+                    if errors:
+                        failed += 1
+                        self.stderr.write(f'line {line_number}: {json.dumps(errors, ensure_ascii=False)}')
+
+                if valid:
+                    with transaction.atomic():
+                        bulk_create_recipes(valid)
+                    imported += len(valid)
+                self.stdout.write(f'{imported} recipes imported, {failed} rows rejected')
+
+        self.stdout.write(self.style.SUCCESS(f'Import finished: {imported} recipes imported, {failed} rows rejected.'))
+
+    def _open(self, path):
+        if path == '-':
+            return open(0, encoding='utf-8', newline='', closefd=False)
+        try:
+            return open(path, encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot open {path}: {e}')
+
+    def _validate(self, row, context, valid):
+        """Validate one row, appending its data to valid. Returns the row errors, if any."""
+        if isinstance(row, ValueError):
+            return {'non_field_errors': [str(row)]}
+        serializer = RecipeImportSerializer(data=row, context=context)
+        if not serializer.is_valid():
+            return serializer.errors
+        valid.append(serializer.validated_data)
+        return None
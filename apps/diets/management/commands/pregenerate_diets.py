@@ -0,0 +1,158 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from apps.diets.models import Diet
+from apps.diets.utils import diet_period, overlapping_diets, user_preferences, generate_week_recipes, NO_PREFERENCES, create_diets
+from apps.users.models import User
+from Nutrimate.core.enums import GenerationMode
+from datetime import date, timedelta
+import multiprocessing
+import contextlib
+import tempfile
+import json
+import os
+
+
+def generate_shard(shard, shard_size, start_date, mode):
+    """Generate the diets of every active user whose id falls in one shard.
+
+    Users that already have a diet overlapping the week are skipped, following
+    the same rule as DietSerializer.validate. All diets of the shard are written
+    in bulk inside a single transaction.
+
+    Returns:
+        A (shard, created, skipped) tuple.
+    """
+    start_date, end_date = diet_period(start_date)
+    users = list(
+        User.objects.filter(
+            is_active=True,
+            id__gte=shard * shard_size,
+            id__lt=(shard + 1) * shard_size,
+        ).select_related('ideal')
+    )
+    user_ids = [user.pk for user in users]
+
+    busy = set(
+        overlapping_diets(start_date, end_date)
+        .filter(user_id__in=user_ids)
+        .values_list('user_id', flat=True)
+    )
+    preferences = user_preferences(user_ids)
+
+    plans = []
+    for user in users:
+        if user.pk in busy:
+            continue
+        tag_ids, ingredient_ids, favorite_ids = preferences.get(user.pk, NO_PREFERENCES)
+        plans.append((
+            Diet(user=user, startDate=start_date, endDate=end_date),
+            generate_week_recipes(user, tag_ids, mode, ingredient_ids, favorite_ids=favorite_ids),
+        ))
+    with transaction.atomic():
+        create_diets(plans)
+
+    return shard, len(plans), len(busy)
+
+
+def _init_worker():
+    # Needed when workers are spawned instead of forked
+    import django
+    django.setup()
+
+
+def _generate_shard_star(args):
+    return generate_shard(*args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate next week's diets for every active user ahead of time, so the "
+        "Monday peak of DietCreateAPIView becomes an off-peak batch. Users are split "
+        "in id shards processed by a pool of worker processes; finished shards are "
+        "recorded in a checkpoint file so an interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start-date', type=date.fromisoformat,
+            help='First day of the generated diets (YYYY-MM-DD), defaults to next Monday'
+        )
+        parser.add_argument('--mode', choices=GenerationMode.values, default=GenerationMode.RANDOM)
+        parser.add_argument('--shard-size', type=int, default=500, help='User ids per shard')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Worker processes, 0 runs every shard in this process'
+        )
+        parser.add_argument('--checkpoint', help='Checkpoint file, defaults to one per start date in the temp dir')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start over')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        start_date = options['start_date'] or today + timedelta(days=7 - today.weekday())
+        shard_size = options['shard_size']
+        if shard_size < 1:
+            raise CommandError('--shard-size must be at least 1')
+
+        checkpoint = options['checkpoint'] or os.path.join(
+            tempfile.gettempdir(), f'nutrimate_pregenerate_{start_date.isoformat()}.json'
+        )
+        done = set() if options['restart'] else self._load_checkpoint(checkpoint, start_date, shard_size)
+
+        user_ids = User.objects.filter(is_active=True).values_list('id', flat=True)
+        shards = sorted({user_id // shard_size for user_id in user_ids} - done)
+        total = len(shards) + len(done)
+        if done:
+            self.stdout.write(f'Resuming from {checkpoint}: {len(done)}/{total} shards already done')
+        if not shards:
+            self.stdout.write(self.style.SUCCESS('Nothing to generate.'))
+            return
+
+        tasks = [(shard, shard_size, start_date, options['mode']) for shard in shards]
+        created = skipped = 0
+
+        pool = None
+        if options['workers'] > 0:
+            # Workers open their own connections, never share the parent's
+            connections.close_all()
+            pool = multiprocessing.Pool(processes=options['workers'], initializer=_init_worker)
+
+        with pool or contextlib.nullcontext():
+            results = pool.imap_unordered(_generate_shard_star, tasks) if pool else map(_generate_shard_star, tasks)
+            for shard, shard_created, shard_skipped in results:
+                created, skipped = created + shard_created, skipped + shard_skipped
+                done.add(shard)
+                self._save_checkpoint(checkpoint, start_date, shard_size, done)
+                self.stdout.write(
+                    f'[{len(done)}/{total} {len(done) * 100 // total}%] '
+                    f'shard {shard}: {shard_created} created, {shard_skipped} skipped'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Diets starting {start_date}: {created} created, {skipped} users already had one.'
+        ))
+
+    def _load_checkpoint(self, path, start_date, shard_size):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return set()
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Unreadable checkpoint {path}: {e}')
+
+        # A checkpoint is only valid for the same week and the same sharding
+        if data.get('start_date') != start_date.isoformat() or data.get('shard_size') != shard_size:
+            return set()
+        return set(data.get('done', []))
+
+    def _save_checkpoint(self, path, start_date, shard_size, done):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'start_date': start_date.isoformat(),
+                'shard_size': shard_size,
+                'done': sorted(done),
+            }, f)
+        # Atomic replace, an interrupted write never corrupts the checkpoint
+        os.replace(tmp_path, path)
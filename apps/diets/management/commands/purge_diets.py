@@ -0,0 +1,64 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from apps.diets.models import Diet, Menu
+from datetime import timedelta
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete menus that do not belong to any diet and, optionally, diets that ended '
+        'more than --retention-days ago. Rows are deleted in small chunks, each in its '
+        'own short transaction, so the command can run against a live database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int,
+            help='Also delete diets whose endDate is older than this many days'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to wait between chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        querysets = [Menu.objects.filter(diet__isnull=True)]
+        if options['retention_days'] is not None:
+            cutoff = timezone.now().date() - timedelta(days=options['retention_days'])
+            querysets.append(Diet.objects.filter(endDate__lt=cutoff))
+
+        reclaimed = {}
+        for queryset in querysets:
+            if options['dry_run']:
+                self.stdout.write(
+                    f'{queryset.model._meta.db_table}: {queryset.count()} rows would be deleted '
+                    '(plus their related rows)'
+                )
+                continue
+            for label, count in self._purge(queryset, options['chunk_size'], options['sleep']).items():
+                reclaimed[label] = reclaimed.get(label, 0) + count
+
+        for label, count in sorted(reclaimed.items()):
+            self.stdout.write(f'{apps.get_model(label)._meta.db_table}: {count} rows deleted')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{sum(reclaimed.values())} rows reclaimed.'))
+
+    def _purge(self, queryset, chunk_size, sleep):
+        """Delete a queryset chunk by chunk and return the deleted rows per model label."""
+        deleted = {}
+        while True:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            with transaction.atomic():
+                # Cascades (menus, menu slots) are deleted in the same short transaction
+                _, per_model = queryset.model.objects.filter(pk__in=ids).delete()
+            for label, count in per_model.items():
+                deleted[label] = deleted.get(label, 0) + count
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:37
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0007_remove_diet_recipes_menu_diet_menus"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="diet",
+            name="startDate",
+            field=models.DateField(default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0008_diet_startdate_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="menu",
+            name="diet",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="diets.diet",
+            ),
+        ),
+        migrations.CreateModel(
+            name="MenuRecipe",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.PositiveSmallIntegerField(
+                        help_text="Posición de la comida en el día: 0 desayuno, 1 almuerzo, 2 cena"
+                    ),
+                ),
+                (
+                    "menu",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="slots",
+                        to="diets.menu",
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="menu_slots",
+                        to="diets.recipe",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["slot"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("menu", "slot"), name="unique_menu_slot"
+                    )
+                ],
+            },
+        ),
+    ]
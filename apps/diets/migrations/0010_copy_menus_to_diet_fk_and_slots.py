@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:05
+
+from django.db import migrations
+
+# Slot of each meal inside a day, matches apps.diets.utils.MEAL_ORDER
+MEAL_SLOTS = {"B": 0, "L": 1, "D": 2}
+BATCH_SIZE = 1000
+
+
+def copy_m2m_to_fk_and_slots(apps, schema_editor):
+    """Move Diet.menus to Menu.diet and Menu.recipes rows to ordered MenuRecipe slots."""
+    Diet = apps.get_model("diets", "Diet")
+    Menu = apps.get_model("diets", "Menu")
+    MenuRecipe = apps.get_model("diets", "MenuRecipe")
+
+    diet_of_menu = {}
+    for diet_id, menu_id in Diet.menus.through.objects.order_by("id").values_list(
+        "diet_id", "menu_id"
+    ):
+        # Menus were never shared between diets, keep the first one if they were
+        diet_of_menu.setdefault(menu_id, diet_id)
+
+    menus = []
+    for menu in Menu.objects.filter(pk__in=list(diet_of_menu)).iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        menu.diet_id = diet_of_menu[menu.pk]
+        menus.append(menu)
+    Menu.objects.bulk_update(menus, ["diet"], batch_size=BATCH_SIZE)
+
+    slots = []
+    taken = set()
+    rows = Menu.recipes.through.objects.order_by("id").values_list(
+        "menu_id", "recipe_id", "recipe__meal"
+    )
+    for menu_id, recipe_id, meal in rows.iterator(chunk_size=BATCH_SIZE):
+        slot = MEAL_SLOTS.get(meal, len(MEAL_SLOTS))
+        # Two recipes of the same meal in one menu: append after the known slots
+        while (menu_id, slot) in taken:
+            slot += 1
+        taken.add((menu_id, slot))
+        slots.append(MenuRecipe(menu_id=menu_id, slot=slot, recipe_id=recipe_id))
+    MenuRecipe.objects.bulk_create(slots, batch_size=BATCH_SIZE)
+
+
+def copy_fk_and_slots_to_m2m(apps, schema_editor):
+    Diet = apps.get_model("diets", "Diet")
+    Menu = apps.get_model("diets", "Menu")
+    MenuRecipe = apps.get_model("diets", "MenuRecipe")
+
+    Diet.menus.through.objects.bulk_create(
+        [
+            Diet.menus.through(diet_id=diet_id, menu_id=menu_id)
+            for menu_id, diet_id in Menu.objects.filter(diet__isnull=False).values_list(
+                "id", "diet_id"
+            )
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    Menu.recipes.through.objects.bulk_create(
+        [
+            Menu.recipes.through(menu_id=menu_id, recipe_id=recipe_id)
+            for menu_id, recipe_id in MenuRecipe.objects.values_list(
+                "menu_id", "recipe_id"
+            ).distinct()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0009_menu_diet_menurecipe"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_m2m_to_fk_and_slots, copy_fk_and_slots_to_m2m),
+    ]
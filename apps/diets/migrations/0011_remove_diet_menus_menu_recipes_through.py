@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0010_copy_menus_to_diet_fk_and_slots"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="diet",
+            name="menus",
+        ),
+        migrations.RemoveField(
+            model_name="menu",
+            name="recipes",
+        ),
+        migrations.AddField(
+            model_name="menu",
+            name="recipes",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="meals",
+                through="diets.MenuRecipe",
+                to="diets.recipe",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="menu",
+            name="diet",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="menus",
+                to="diets.diet",
+            ),
+        ),
+        migrations.AlterModelOptions(
+            name="menu",
+            options={"ordering": ["day"]},
+        ),
+        migrations.AddConstraint(
+            model_name="menu",
+            constraint=models.UniqueConstraint(
+                fields=("diet", "day"), name="unique_diet_day"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0011_remove_diet_menus_menu_recipes_through"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="diet",
+            index=models.Index(
+                fields=["user", "startDate"], name="diet_user_start_idx"
+            ),
+        ),
+    ]
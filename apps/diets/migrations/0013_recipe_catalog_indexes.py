@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0012_diet_user_start_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["meal", "goal", "id"], name="recipe_meal_goal_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(fields=["goal", "id"], name="recipe_goal_idx"),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:50
+
+from django.db import migrations
+import re
+
+BATCH_SIZE = 1000
+
+# Frozen copy of apps.diets.models.parse_ingredients at the time of this migration
+INGREDIENT_UNITS = {
+    "g", "gr", "kg", "mg", "ml", "l", "oz", "lb",
+    "taza", "tazas", "cucharada", "cucharadas", "cucharadita", "cucharaditas",
+    "unidad", "unidades", "pizca", "diente", "dientes",
+}
+
+
+def parse_ingredients(ingredients):
+    parsed = {}
+    for entry in ingredients if isinstance(ingredients, list) else []:
+        quantity, unit = None, ""
+        if isinstance(entry, dict):
+            name = entry.get("name") or ""
+            quantity, unit = entry.get("quantity"), str(entry.get("unit") or "")
+            try:
+                quantity = float(quantity) if quantity is not None else None
+            except (TypeError, ValueError):
+                quantity = None
+        else:
+            name = str(entry)
+            match = re.match(r"\s*(\d+(?:[.,]\d+)?)\s*(.*)", name)
+            if match:
+                quantity, name = float(match.group(1).replace(",", ".")), match.group(2)
+                words = name.split(maxsplit=1)
+                if words and words[0].lower().rstrip(".") in INGREDIENT_UNITS:
+                    unit, name = words[0].rstrip("."), words[1] if len(words) > 1 else ""
+                name = re.sub(r"^de\s+", "", name.strip(), flags=re.IGNORECASE)
+        name = " ".join(str(name).lower().split())[:100]
+        if name and name not in parsed:
+            parsed[name] = (name, quantity, unit[:20])
+    return list(parsed.values())
+
+
+def backfill_recipe_ingredients(apps, schema_editor):
+    """Create Ingredient and RecipeIngredient rows from every Recipe.ingredients."""
+    Recipe = apps.get_model("diets", "Recipe")
+    Ingredient = apps.get_model("diets", "Ingredient")
+    RecipeIngredient = apps.get_model("diets", "RecipeIngredient")
+
+    recipes = Recipe.objects.order_by("id").values_list("id", "ingredients")
+    parsed = {
+        recipe_id: parse_ingredients(ingredients)
+        for recipe_id, ingredients in recipes.iterator(chunk_size=BATCH_SIZE)
+    }
+    names = {name for entries in parsed.values() for name, _, _ in entries}
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name) for name in sorted(names)],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    ids = dict(Ingredient.objects.values_list("name", "id"))
+    RecipeIngredient.objects.bulk_create(
+        [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ids[name],
+                quantity=quantity,
+                unit=unit,
+            )
+            for recipe_id, entries in parsed.items()
+            for name, quantity, unit in entries
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0015_ingredient_recipeingredient"),
+    ]
+
+    operations = [
+        # Nothing to undo, reversing 0015 drops the tables with their rows
+        migrations.RunPython(backfill_recipe_ingredients, migrations.RunPython.noop),
+    ]
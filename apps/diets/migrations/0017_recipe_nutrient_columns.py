@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0016_backfill_recipe_ingredients"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="calories",
+            field=models.FloatField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="carbs",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="fat",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="protein",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["meal", "calories"], name="recipe_meal_calories_idx"
+            ),
+        ),
+    ]
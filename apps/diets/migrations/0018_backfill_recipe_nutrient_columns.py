@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:53
+
+from django.db import migrations
+import re
+
+BATCH_SIZE = 1000
+
+# Frozen copy of apps.diets.models.parse_nutrients at the time of this migration
+NUTRIENT_KEYS = ["calories", "protein", "carbs", "fat"]
+
+
+def parse_nutrients(nutritional_info):
+    values = []
+    for key in NUTRIENT_KEYS:
+        value = nutritional_info.get(key) if isinstance(nutritional_info, dict) else None
+        if isinstance(value, str):
+            match = re.match(r"\s*(-?\d+(?:[.,]\d+)?)", value)
+            value = match.group(1).replace(",", ".") if match else None
+        try:
+            values.append(float(value) if value is not None else None)
+        except (TypeError, ValueError):
+            values.append(None)
+    return values
+
+
+def backfill_nutrient_columns(apps, schema_editor):
+    """Fill the typed nutrient columns from every Recipe.nutritional_info."""
+    Recipe = apps.get_model("diets", "Recipe")
+
+    batch = []
+    for recipe in Recipe.objects.only("id", "nutritional_info").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        for key, value in zip(NUTRIENT_KEYS, parse_nutrients(recipe.nutritional_info)):
+            setattr(recipe, key, value)
+        batch.append(recipe)
+        if len(batch) == BATCH_SIZE:
+            Recipe.objects.bulk_update(batch, NUTRIENT_KEYS)
+            batch = []
+    Recipe.objects.bulk_update(batch, NUTRIENT_KEYS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0017_recipe_nutrient_columns"),
+    ]
+
+    operations = [
+        # Nothing to undo, reversing 0017 drops the columns
+        migrations.RunPython(backfill_nutrient_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0018_backfill_recipe_nutrient_columns"),
+        ("users", "0012_household"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="diet",
+            name="household",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="diets",
+                to="users.household",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 09:12
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # Backs the shared DatabaseCache configured in settings.CACHES
+    call_command("createcachetable", database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0020_recipe_ratings"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
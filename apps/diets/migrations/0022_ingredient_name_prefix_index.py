@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0021_create_cache_table"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ingredient",
+            index=models.Index(
+                fields=["name"],
+                name="ingredient_name_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:20
+
+import time
+
+from django.db import migrations, models
+
+
+def create_version_row(apps, schema_editor):
+    # Starts from the clock, like the cache counter it replaces, so no version
+    # keying a page still in the cache is reused
+    CatalogVersion = apps.get_model("diets", "CatalogVersion")
+    CatalogVersion.objects.create(pk=1, version=time.time_ns())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0022_ingredient_name_prefix_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_version_row, migrations.RunPython.noop),
+    ]
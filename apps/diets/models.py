@@ -1,5 +1,101 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from Nutrimate.core.enums import Goal
+from datetime import date
+import copy
+import re
+
+
+# Well-known keys of Recipe.nutritional_info (kcal and grams), also the names of
+# the typed Recipe columns that mirror them
+NUTRIENT_KEYS = ['calories', 'protein', 'carbs', 'fat']
+
+
+def parse_nutrients(nutritional_info):
+    """Read the well-known nutrients of a recipe as floats.
+
+    Values may be numbers or strings starting with a number (e.g. "250 kcal").
+    Missing or unreadable values are returned as None.
+    """
+    values = []
+    for key in NUTRIENT_KEYS:
+        value = nutritional_info.get(key) if isinstance(nutritional_info, dict) else None
+        if isinstance(value, str):
+            match = re.match(r'\s*(-?\d+(?:[.,]\d+)?)', value)
+            value = match.group(1).replace(',', '.') if match else None
+        try:
+            values.append(float(value) if value is not None else None)
+        except (TypeError, ValueError):
+            values.append(None)
+    return values
+
+
+# Denormalized aggregates of Rating, only ever changed with F() updates
+RATING_FIELDS = ['rating_count', 'rating_sum']
+
+# JSON fields of Recipe whose derived data (ingredient rows, cached diet
+# aggregates) is only rebuilt by post_save when they actually change
+TRACKED_FIELDS = ['ingredients', 'nutritional_info']
+
+
+# Units recognized at the start of a plain text ingredient ("200 g arroz")
+INGREDIENT_UNITS = {
+    'g', 'gr', 'kg', 'mg', 'ml', 'l', 'oz', 'lb',
+    'taza', 'tazas', 'cucharada', 'cucharadas', 'cucharadita', 'cucharaditas',
+    'unidad', 'unidades', 'pizca', 'diente', 'dientes',
+}
+
+
+def normalize_ingredient_name(name):
+    """Lower-case an ingredient name and collapse its whitespace."""
+    return ' '.join(str(name).lower().split())[:100]
+
+
+def parse_ingredients(ingredients):
+    """Read the entries of Recipe.ingredients as (name, quantity, unit) tuples.
+
+    Entries may be plain strings ("200 g de arroz", "2 huevos", "sal") or objects
+    with a name and optional quantity and unit. Names are normalized, entries
+    without one are skipped and only the first entry of a repeated name is kept.
+    """
+    parsed = {}
+    for entry in ingredients if isinstance(ingredients, list) else []:
+        quantity, unit = None, ''
+        if isinstance(entry, dict):
+            name = entry.get('name') or ''
+            quantity, unit = entry.get('quantity'), str(entry.get('unit') or '')
+            try:
+                quantity = float(quantity) if quantity is not None else None
+            except (TypeError, ValueError):
+                quantity = None
+        else:
+            name = str(entry)
+            match = re.match(r'\s*(\d+(?:[.,]\d+)?)\s*(.*)', name)
+            if match:
+                quantity, name = float(match.group(1).replace(',', '.')), match.group(2)
+                words = name.split(maxsplit=1)
+                if words and words[0].lower().rstrip('.') in INGREDIENT_UNITS:
+                    unit, name = words[0].rstrip('.'), words[1] if len(words) > 1 else ''
+                name = re.sub(r'^de\s+', '', name.strip(), flags=re.IGNORECASE)
+        name = normalize_ingredient_name(name)
+        if name and name not in parsed:
+            parsed[name] = (name, quantity, unit[:20])
+    return list(parsed.values())
+
+
+class DietQuerySet(models.QuerySet):
+    def with_menus(self, *related):
+        """Prefetch every menu of the diets with its recipes in slot order.
+
+        Costs one query for the menus and one for the slots joined with their
+        recipes, whatever the number of diets. Extra lookups relative to the
+        recipe (e.g. 'tags') are prefetched as well.
+        """
+        slots = MenuRecipe.objects.select_related('recipe')
+        if related:
+            slots = slots.prefetch_related(*(f'recipe__{lookup}' for lookup in related))
+        return self.prefetch_related(models.Prefetch('menus__slots', queryset=slots))
+
 
 class Diet(models.Model):
     user = models.ForeignKey(
@@ -8,13 +104,25 @@ class Diet(models.Model):
         related_name='diets',
         null=True
     )
-    startDate = models.DateField(auto_now_add=True)
-    endDate = models.DateField()
-    menus = models.ManyToManyField(
-        'diets.Menu',
+    # Set on the linked diets written for every member by a household plan
+    household = models.ForeignKey(
+        'users.Household',
+        on_delete=models.SET_NULL,
         related_name='diets',
-        blank=True,
+        null=True,
+        blank=True
     )
+    startDate = models.DateField(default=date.today)
+    endDate = models.DateField()
+
+    objects = DietQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs the per-user history, paginated by startDate
+            models.Index(fields=['user', 'startDate'], name='diet_user_start_idx'),
+        ]
+
     def __str__(self):
         return f"Diet from {self.startDate} to {self.endDate}"
 
@@ -26,6 +134,8 @@ class Meal(models.TextChoices):
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.TextField(blank=True)
+    # Backs the incremental catalog sync feed
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -50,15 +160,237 @@ class Recipe(models.Model):
         related_name='recipes',
         blank=True,
     )
+    # Also bumped when the recipe's tags change, see apps.diets.signals
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # Typed copies of the NUTRIENT_KEYS of nutritional_info, kept in sync by
+    # sync_nutrients() so totals can be computed with Sum() in the database
+    calories = models.FloatField(null=True, blank=True, editable=False, db_index=True)
+    protein = models.FloatField(null=True, blank=True, editable=False)
+    carbs = models.FloatField(null=True, blank=True, editable=False)
+    fat = models.FloatField(null=True, blank=True, editable=False)
+
+    # Aggregates of the recipe's ratings, maintained by apps.diets.utils.rate_recipes
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Back the catalog filters, both end with id to serve the cursor ordering
+            models.Index(fields=['meal', 'goal', 'id'], name='recipe_meal_goal_idx'),
+            models.Index(fields=['goal', 'id'], name='recipe_goal_idx'),
+            models.Index(fields=['meal', 'calories'], name='recipe_meal_calories_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    def sync_nutrients(self):
+        """Copy the well-known nutrients of nutritional_info to the typed columns.
+
+        Called by save(); bulk inserts must call it on every recipe themselves.
+        """
+        for key, value in zip(NUTRIENT_KEYS, parse_nutrients(self.nutritional_info)):
+            setattr(self, key, value)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recipe = super().from_db(db, field_names, values)
+        recipe._remember_tracked()
+        return recipe
+
+    def _remember_tracked(self, names=TRACKED_FIELDS):
+        # Deep copies, so in-place edits of the JSON are seen as changes
+        tracked = self.__dict__.setdefault('_tracked', {})
+        for name in TRACKED_FIELDS:
+            if name in names and name in self.__dict__:
+                tracked[name] = copy.deepcopy(self.__dict__[name])
+
+    def changed_fields(self, update_fields=None):
+        """Return the TRACKED_FIELDS a save writes with a new value.
+
+        Fields are compared with the values last loaded or saved; a field whose
+        previous value is unknown counts as changed.
+        """
+        tracked = getattr(self, '_tracked', {})
+        return {
+            name for name in TRACKED_FIELDS
+            if name in self.__dict__
+            and (update_fields is None or name in update_fields)
+            and (name not in tracked or self.__dict__[name] != tracked[name])
+        }
+
+    @property
+    def rating_average(self):
+        """Average score of the recipe, None while it has no ratings."""
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def save(self, *args, **kwargs):
+        self.sync_nutrients()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nutritional_info' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *NUTRIENT_KEYS}
+        elif update_fields is None and not self._state.adding:
+            # Saving a loaded recipe must not write back stale rating counters
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RATING_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        # Fields left out of update_fields keep their unsaved changes
+        update_fields = kwargs.get('update_fields')
+        self._remember_tracked(TRACKED_FIELDS if update_fields is None else update_fields)
     
 class Menu(models.Model):
+    diet = models.ForeignKey(
+        'diets.Diet',
+        on_delete=models.CASCADE,
+        related_name='menus',
+        null=True,
+        blank=True
+    )
     day = models.IntegerField()
     recipes = models.ManyToManyField(
         'diets.Recipe',
+        through='diets.MenuRecipe',
         related_name='meals',
         blank=True
     )
-    
\ No newline at end of file
+
+    class Meta:
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['diet', 'day'], name='unique_diet_day'),
+        ]
+
+    @property
+    def ordered_recipes(self):
+        """Recipes of the menu in slot order (breakfast, lunch, dinner)."""
+        return [slot.recipe for slot in self.slots.all()]
+
+
+class MenuRecipe(models.Model):
+    """Recipe served in one meal slot of a menu."""
+    menu = models.ForeignKey(
+        'diets.Menu',
+        on_delete=models.CASCADE,
+        related_name='slots'
+    )
+    slot = models.PositiveSmallIntegerField(
+        help_text="Posición de la comida en el día: 0 desayuno, 1 almuerzo, 2 cena"
+    )
+    recipe = models.ForeignKey(
+        'diets.Recipe',
+        on_delete=models.CASCADE,
+        related_name='menu_slots'
+    )
+
+    class Meta:
+        ordering = ['slot']
+        constraints = [
+            models.UniqueConstraint(fields=['menu', 'slot'], name='unique_menu_slot'),
+        ]
+
+
+class Ingredient(models.Model):
+    """An ingredient name, normalized with normalize_ingredient_name."""
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        indexes = [
+            # The unique index compares with the database collation, which
+            # PostgreSQL cannot use for LIKE 'prefix%'; pattern_ops can
+            models.Index(fields=['name'], name='ingredient_name_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIngredient(models.Model):
+    """Normalized copy of one entry of Recipe.ingredients, kept in sync on save.
+
+    The JSON field stays the source shown to clients; these rows back the
+    ingredient lookups and the ingredient exclusions of diet generation.
+    """
+    recipe = models.ForeignKey(
+        'diets.Recipe',
+        on_delete=models.CASCADE,
+        related_name='recipe_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        'diets.Ingredient',
+        on_delete=models.CASCADE,
+        related_name='recipe_ingredients'
+    )
+    quantity = models.FloatField(null=True, blank=True)
+    unit = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'], name='unique_recipe_ingredient'),
+        ]
+        indexes = [
+            # Inverted lookup: the recipes containing an ingredient
+            models.Index(fields=['ingredient', 'recipe'], name='ingredient_recipe_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.ingredient_id}"
+
+
+class Rating(models.Model):
+    """A user's score for a recipe, from 1 to 5.
+
+    Recipe.rating_count and Recipe.rating_sum hold the aggregates, so rating
+    rows are only read to find a user's previous score.
+    """
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+        related_name='ratings'
+    )
+    recipe = models.ForeignKey(
+        'diets.Recipe',
+        on_delete=models.CASCADE,
+        related_name='ratings'
+    )
+    score = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(5)]
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'], name='unique_user_recipe_rating'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} rated {self.recipe_id}: {self.score}"
+
+
+class CatalogVersion(models.Model):
+    """Single row counting the writes to the tag and recipe catalog.
+
+    See apps.diets.catalog.catalog_version. The counter is bumped by an
+    UPDATE ... SET version = version + 1, so concurrent writers never lose
+    an increment.
+    """
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+class Tombstone(models.Model):
+    """Records the deletion of a tag or recipe for the incremental sync feed."""
+    TAG = 'tag'
+    RECIPE = 'recipe'
+    KIND_CHOICES = [(TAG, 'Tag'), (RECIPE, 'Recipe')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
@@ -0,0 +1,119 @@
+from apps.diets.utils import MEAL_ORDER
+from Nutrimate.core.enums import Goal
+import numpy as np
+
+
+# Share of the daily target covered by breakfast, lunch and dinner (MEAL_ORDER)
+MEAL_SHARES = np.array([0.25, 0.40, 0.35], dtype=np.float32)
+
+# Daily calorie adjustment (kcal) and macro split (protein, carbs, fat) per goal
+GOAL_CALORIE_OFFSET = {
+    Goal.LOSE_WEIGHT: -500,
+    Goal.GAIN_WEIGHT: 400,
+    Goal.NUTRITION: 0,
+}
+GOAL_MACRO_SPLIT = {
+    Goal.LOSE_WEIGHT: (0.30, 0.40, 0.30),
+    Goal.GAIN_WEIGHT: (0.25, 0.50, 0.25),
+    Goal.NUTRITION: (0.20, 0.50, 0.30),
+}
+ACTIVITY_FACTOR = 1.4
+MIN_DAILY_CALORIES = 1200
+
+# Weight of the relative error of calories, protein, carbs and fat in the score
+NUTRIENT_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0], dtype=np.float32)
+
+# Score added each time a recipe is repeated in the week, to keep some variety
+REPEAT_PENALTY = 0.02
+
+# Candidates kept per meal: the search scores CANDIDATES_PER_MEAL ** 3 combinations,
+# sampled from the SHORTLIST_FACTOR times larger set of recipes closest to the meal
+# target. This keeps the latency bounded whatever the size of the catalog.
+CANDIDATES_PER_MEAL = 40
+SHORTLIST_FACTOR = 4
+
+
+def daily_target(user):
+    """Estimate the daily calories and macros (kcal, g) a user should eat.
+
+    Uses the Mifflin-St Jeor equation with the average of its male and female
+    constants (the user's sex is not stored), a light activity factor and an
+    offset and macro split that depend on the user's Ideal.goal.
+
+    Returns:
+        A NumPy array [calories, protein, carbs, fat].
+    """
+    goal = user.ideal.goal if user.ideal else Goal.NUTRITION
+    bmr = 10 * user.weight + 6.25 * user.height - 5 * user.age - 78
+    calories = max(bmr * ACTIVITY_FACTOR + GOAL_CALORIE_OFFSET.get(goal, 0), MIN_DAILY_CALORIES)
+    protein, carbs, fat = GOAL_MACRO_SPLIT.get(goal, GOAL_MACRO_SPLIT[Goal.NUTRITION])
+    return np.array(
+        [calories, calories * protein / 4, calories * carbs / 4, calories * fat / 9],
+        dtype=np.float32,
+    )
+
+
+def _score(totals, target):
+    """Weighted squared relative error of nutrient totals (..., nutrients) against target."""
+    relative = (totals - target) / target
+    return (relative ** 2) @ NUTRIENT_WEIGHTS
+
+
+def _shortlist(ids, nutrients, target, rng):
+    """Keep the candidates of one meal: a random sample of the recipes closest to target."""
+    keep = min(len(ids), CANDIDATES_PER_MEAL * SHORTLIST_FACTOR)
+    closest = np.argpartition(_score(nutrients, target), keep - 1)[:keep]
+    chosen = rng.choice(closest, size=min(keep, CANDIDATES_PER_MEAL), replace=False)
+    return ids[chosen], nutrients[chosen]
+
+
+def optimize_week(pools, target, rng=None, weeks=1, recent=frozenset()):
+    """Pick the 21 recipes of a week so each day lands close to a nutrition target.
+
+    Every (breakfast, lunch, dinner) combination of the shortlisted candidates is
+    scored at once with NumPy broadcasting; each day then takes the best
+    combination, with a penalty for recipes already used in the plan.
+
+    Args:
+        pools (dict): {meal: (ids, nutrients)} as returned by RecipeIndex.eligible_nutrients.
+        target: Daily target as returned by daily_target.
+        rng: Optional numpy.random.Generator.
+        weeks (int): Number of consecutive weeks to plan. The scores are computed
+            once and the repeat penalty carries over from week to week.
+        recent (set): Recipe ids eaten lately, they start with one use of penalty.
+
+    Returns:
+        A flat list of 21 * weeks recipe ids (or None), ordered day by day in MEAL_ORDER.
+    """
+    rng = rng or np.random.default_rng()
+    target = np.asarray(target, dtype=np.float32)
+
+    candidates = []
+    for share, meal in zip(MEAL_SHARES, MEAL_ORDER):
+        ids, nutrients = pools[meal]
+        if len(ids) == 0:
+            # Placeholder that adds nothing to the day and becomes an empty slot
+            ids, nutrients = np.array([-1]), np.zeros((1, len(target)), dtype=np.float32)
+        candidates.append(_shortlist(ids, nutrients, target * share, rng))
+
+    (b_ids, b), (l_ids, l), (d_ids, d) = candidates
+    # Daily totals of every combination, shape (breakfasts, lunches, dinners, nutrients)
+    scores = _score(b[:, None, None, :] + l[None, :, None, :] + d[None, None, :, :], target)
+
+    recent = np.fromiter(recent, dtype=np.int64, count=len(recent))
+    uses = [np.isin(ids, recent).astype(np.float64) for ids in (b_ids, l_ids, d_ids)]
+    days = []
+    for _ in range(7 * weeks):
+        penalty = REPEAT_PENALTY * (uses[0][:, None, None] + uses[1][None, :, None] + uses[2][None, None, :])
+        i, j, k = np.unravel_index(np.argmin(scores + penalty), scores.shape)
+        uses[0][i] += 1
+        uses[1][j] += 1
+        uses[2][k] += 1
+        days.append((b_ids[i], l_ids[j], d_ids[k]))
+
+    # Best days are found first, shuffle each week so quality does not follow the weekday
+    result = []
+    for week in range(weeks):
+        for day_idx in rng.permutation(7) + week * 7:
+            result.extend(None if recipe_id == -1 else int(recipe_id) for recipe_id in days[day_idx])
+    return result
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.diets.models import Diet, Recipe, Tag, Tombstone
+from apps.diets.catalog import recipe_index, catalog_changed
+
+
+# Index updates and catalog version bumps run on commit so a rolled back write
+# never reaches the index or the cached catalog responses. The bump is queued
+# after the index patch, so this process keeps its patched index
+
+
+def touch_recipes(recipe_ids):
+    """Bump updated_at of recipes whose tags changed, so the sync feed returns them."""
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, update_fields=None, **kwargs):
+    from apps.diets.utils import sync_recipe_ingredients, invalidate_diet_caches, diets_using_recipes
+
+    recipe_id, goal, meal, info = instance.pk, instance.goal, instance.meal, instance.nutritional_info
+    changed = instance.changed_fields(update_fields)
+    # The ingredient rows are only rebuilt when the JSON they come from changed
+    ingredient_ids = None
+    if created or 'ingredients' in changed:
+        ingredient_ids = sync_recipe_ingredients([instance], created=created)[recipe_id]
+    if changed and not created:
+        # Diet aggregates only read the nutrients and the ingredients
+        invalidate_diet_caches(diets_using_recipes([recipe_id]))
+
+    def apply():
+        recipe_index.save_recipe(recipe_id, goal, meal, info)
+        if ingredient_ids is not None:
+            recipe_index.set_ingredients(recipe_id, ingredient_ids)
+
+    transaction.on_commit(apply)
+    catalog_changed(index_patched=True)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    from apps.diets.utils import invalidate_diet_caches, diets_using_recipes
+
+    # The menu slots of the recipe are only known before the cascade
+    invalidate_diet_caches(diets_using_recipes([instance.pk]))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: recipe_index.delete_recipe(recipe_id))
+    Tombstone.objects.create(kind=Tombstone.RECIPE, object_id=recipe_id)
+    catalog_changed(index_patched=True)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, **kwargs):
+    # A tag only reaches the index through Recipe.tags
+    catalog_changed(index_patched=True)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    # The recipes losing the tag are only known before the cascade
+    touch_recipes(instance.recipes.values('pk'))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    # The cascade on Recipe.tags does not send m2m_changed, so rebuild instead
+    transaction.on_commit(recipe_index.invalidate)
+    Tombstone.objects.create(kind=Tombstone.TAG, object_id=instance.pk)
+    catalog_changed()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        touch_recipes(instance.recipes.values('pk'))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # instance is a Tag and pk_set holds recipe ids
+        if action == 'post_clear':
+            transaction.on_commit(recipe_index.invalidate)
+            catalog_changed()
+            return
+        touch_recipes(pk_set)
+        pairs = [(recipe_id, [instance.pk]) for recipe_id in pk_set]
+    else:
+        touch_recipes([instance.pk])
+        pairs = [(instance.pk, None if action == 'post_clear' else list(pk_set))]
+
+    def apply():
+        for recipe_id, tag_ids in pairs:
+            if action == 'post_add':
+                recipe_index.add_tags(recipe_id, tag_ids)
+            else:
+                recipe_index.remove_tags(recipe_id, tag_ids)
+
+    transaction.on_commit(apply)
+    catalog_changed(index_patched=True)
+
+
+@receiver(pre_delete, sender='users.User')
+def user_deleting(sender, instance, **kwargs):
+    from apps.diets.utils import forget_ratings
+
+    # The ratings of the user are only known before the cascade
+    forget_ratings(instance)
+
+
+@receiver(post_delete, sender=Diet)
+def diet_deleted(sender, instance, **kwargs):
+    from apps.diets.utils import invalidate_diet_caches
+
+    invalidate_diet_caches([instance.pk])
@@ -1,10 +1,19 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from django.urls import reverse
+from django.core.cache import cache
 from apps.users.models import User
 from apps.diets.models import Tag, Recipe, Diet, Menu
+from apps.diets.catalog import recipe_index
+from Nutrimate.settings.base import CACHES as SHARED_CACHES
 
+# Query counts measure the app's own queries, the shared database cache of
+# settings.CACHES would add its own; a single test process needs no sharing.
+# Tests counting the cache queries too run on SHARED_CACHES.
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
+
+@override_settings(CACHES=LOCAL_CACHES)
 class DietsAPITestCase(TestCase):
 	def setUp(self):
 		from apps.users.models import Ideal
@@ -39,6 +48,9 @@ class DietsAPITestCase(TestCase):
 		)
 
 		self.client = APIClient()
+		# The recipe index and the catalog cache are process-wide, start every test from the database
+		recipe_index.invalidate()
+		cache.clear()
   
     # ---------- TEST CASES ----------
 
@@ -95,7 +107,506 @@ class DietsAPITestCase(TestCase):
 		for menu in diet.menus.all():
 			self.assertEqual(menu.recipes.count(), 3)
 
+	def test_recipe_list_is_paginated_filtered_and_constant_in_queries(self):
+		veg = Tag.objects.create(name='veg', description='veg')
+		nuts = Tag.objects.create(name='nuts', description='nuts')
+		for i in range(12):
+			recipe = Recipe.objects.create(
+				name=f'R{i}', description='r', ingredients=[], preparation_steps='x',
+				nutritional_info={}, meal='B' if i % 2 else 'L', goal='N'
+			)
+			recipe.tags.set([veg, nuts] if i % 3 == 0 else [veg])
+
+		url = reverse('recipe-list-create')
+		self.client.force_authenticate(user=self.admin)
+
+		# catalog version, recipes page and prefetched tags, whatever the page size
+		for page_size in (2, 10):
+			with self.assertNumQueries(3):
+				resp = self.client.get(url, {'page_size': page_size})
+			self.assertEqual(len(resp.json()['results']), page_size)
+		self.assertEqual(resp.json()['results'][0]['tags'], [veg.id, nuts.id])
+
+		resp = self.client.get(resp.json()['next'])
+		self.assertEqual([r['name'] for r in resp.json()['results']], ['R10', 'R11'])
+
+		resp = self.client.get(url, {'meal': 'B', 'tags': f'{veg.id},{nuts.id}', 'exclude_tags': nuts.id})
+		self.assertEqual([r['name'] for r in resp.json()['results']], ['R1', 'R5', 'R7', 'R11'])
+
+	@override_settings(CACHES=SHARED_CACHES)
+	def test_catalog_lists_are_cached_until_the_catalog_changes(self):
+		Tag.objects.create(name='egg', description='egg')
+		url = reverse('tag-list-create')
+
+		resp = self.client.get(url)
+		etag = resp['ETag']
+		self.assertEqual([tag['name'] for tag in resp.json()], ['egg'])
+
+		# Same version, the catalog is not queried: a 304 only reads the
+		# version row, pre-rendered bytes also read the database cache
+		with self.assertNumQueries(1):
+			resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp.status_code, 304)
+		with self.assertNumQueries(2):
+			resp = self.client.get(url)
+		self.assertEqual([tag['name'] for tag in resp.json()], ['egg'])
+
+		with self.captureOnCommitCallbacks(execute=True):
+			Tag.objects.create(name='milk', description='milk')
+
+		resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp.status_code, 200)
+		self.assertNotEqual(resp['ETag'], etag)
+		self.assertEqual([tag['name'] for tag in resp.json()], ['egg', 'milk'])
+
+	def test_catalog_changes_feed_returns_only_deltas_since_cursor(self):
+		from datetime import datetime, timedelta, timezone as dt_timezone
+		from django.utils import timezone
+
+		egg = Tag.objects.create(name='egg', description='egg')
+		milk = Tag.objects.create(name='milk', description='milk')
+		kept = Recipe.objects.create(name='K', description='k', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+		kept.tags.set([egg])
+		gone = Recipe.objects.create(name='G', description='g', ingredients=[], preparation_steps='x', nutritional_info={}, meal='L', goal='N')
+		untouched = Recipe.objects.create(name='U', description='u', ingredients=[], preparation_steps='x', nutritional_info={}, meal='D', goal='N')
+
+		url = reverse('catalog-changes')
+		self.client.force_authenticate(user=self.user)
+		resp = self.client.get(url)
+		self.assertEqual(len(resp.data['tags']), 2)
+		self.assertEqual(len(resp.data['recipes']), 3)
+
+		# Age the catalog so the next sync starts after it
+		an_hour_ago = timezone.now() - timedelta(hours=1)
+		Tag.objects.update(updated_at=an_hour_ago)
+		Recipe.objects.update(updated_at=an_hour_ago)
+		since = str((timezone.now() - timedelta(minutes=30) - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(microseconds=1))
+
+		resp = self.client.get(url, {'since': since})
+		self.assertEqual((resp.data['tags'], resp.data['recipes']), ([], []))
+
+		kept.tags.add(milk)
+		self.client.force_authenticate(user=self.admin)
+		self.client.delete(reverse('recipe-delete', args=[gone.id]))
+		self.client.delete(reverse('tag-delete', args=[egg.id]))
+
+		resp = self.client.get(url, {'since': since})
+		self.assertEqual(resp.data['tags'], [])
+		self.assertEqual([r['id'] for r in resp.data['recipes']], [kept.id])
+		self.assertEqual(resp.data['recipes'][0]['tags'], [milk.id])
+		self.assertEqual(resp.data['deleted'], {'tags': [egg.id], 'recipes': [gone.id]})
+		self.assertNotIn(untouched.id, [r['id'] for r in resp.data['recipes']])
+
+		self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+
+	def test_recipe_list_filters_by_ingredient(self):
+		from apps.diets.models import Ingredient
+
+		for name, ingredients in (('PB', ['pan', 'maní']), ('OA', ['avena']), ('AR', ['arroz', 'pan'])):
+			Recipe.objects.create(name=name, description='x', ingredients=ingredients, preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+		ids = dict(Ingredient.objects.values_list('name', 'id'))
+
+		self.client.force_authenticate(user=self.admin)
+		resp = self.client.get(reverse('ingredient-list'), {'search': 'A'})
+		self.assertEqual([i['name'] for i in resp.data], ['arroz', 'avena'])
+
+		url = reverse('recipe-list-create')
+		resp = self.client.get(url, {'ingredients': ids['pan'], 'exclude_ingredients': ids['maní']})
+		self.assertEqual([r['name'] for r in resp.json()['results']], ['AR'])
+
+	def test_recipe_list_filters_by_nutrient_bounds(self):
+		for name, calories in (('A', 250), ('B', '480 kcal'), ('C', 700)):
+			Recipe.objects.create(name=name, description='x', ingredients=[], preparation_steps='x', nutritional_info={'calories': calories}, meal='L', goal='N')
+		Recipe.objects.create(name='N', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal='L', goal='N')
+
+		self.client.force_authenticate(user=self.admin)
+		resp = self.client.get(reverse('recipe-list-create'), {'min_calories': 300, 'max_calories': 500})
+		self.assertEqual([r['name'] for r in resp.json()['results']], ['B'])
+
+	def test_diet_summary_is_aggregated_once_and_cached_until_a_recipe_changes(self):
+		for meal, calories in (('B', 400), ('L', 700), ('D', 600)):
+			Recipe.objects.create(
+				name=meal, description='x', ingredients=[], preparation_steps='x',
+				nutritional_info={'calories': calories, 'protein': 30}, meal=meal, goal='N'
+			)
+		self.client.force_authenticate(user=self.user)
+		diet_id = self.client.post(reverse('diet-api'), {}, format='json').data['id']
+		url = reverse('diet-summary', args=[diet_id])
+
+		# diet ownership and the aggregate
+		with self.assertNumQueries(2):
+			resp = self.client.get(url)
+		self.assertEqual(len(resp.data['days']), 7)
+		self.assertEqual(resp.data['days'][0], {'day': 1, 'recipes': 3, 'incomplete': 0, 'calories': 1700.0, 'protein': 90.0, 'carbs': 0, 'fat': 0})
+		self.assertEqual(resp.data['week']['calories'], 7 * 1700.0)
+
+		with self.assertNumQueries(1):
+			self.client.get(url)
+
+		# Edits that leave the nutrients and ingredients alone keep the cache
+		lunch = Recipe.objects.get(name='L')
+		lunch.name = 'Lunch'
+		with self.captureOnCommitCallbacks(execute=True):
+			lunch.save()
+		with self.assertNumQueries(1):
+			self.client.get(url)
+
+		lunch.nutritional_info = {'calories': 500}
+		with self.captureOnCommitCallbacks(execute=True):
+			lunch.save()
+		resp = self.client.get(url)
+		self.assertEqual(resp.data['week']['calories'], 7 * 1500.0)
+		self.assertEqual(resp.data['week']['protein'], 7 * 60.0)
+
+		self.client.force_authenticate(user=self.admin)
+		self.assertEqual(self.client.get(url).status_code, 404)
+
+	@override_settings(CACHES=SHARED_CACHES)
+	def test_diet_cache_invalidation_deletes_keys_in_batches(self):
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+		from apps.diets.utils import invalidate_diet_caches
+
+		# Two keys per diet, 500 keys per DELETE
+		with CaptureQueriesContext(connection) as queries:
+			with self.captureOnCommitCallbacks(execute=True):
+				invalidate_diet_caches(range(600))
+		self.assertEqual(len([q for q in queries if q['sql'].startswith('DELETE')]), 3)
+
+	def test_diet_shopping_list_sums_the_week_and_is_cached(self):
+		Recipe.objects.create(name='B', description='x', ingredients=['2 huevos', '100 g de pan', 'sal'], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+		Recipe.objects.create(name='L', description='x', ingredients=['0.2 kg de arroz', 'sal'], preparation_steps='x', nutritional_info={}, meal='L', goal='N')
+		Recipe.objects.create(name='D', description='x', ingredients=['50 G de arroz', '1 huevos'], preparation_steps='x', nutritional_info={}, meal='D', goal='N')
+		self.client.force_authenticate(user=self.user)
+		diet_id = self.client.post(reverse('diet-api'), {}, format='json').data['id']
+		url = reverse('diet-shopping-list', args=[diet_id])
+
+		# diet ownership and the aggregate
+		with self.assertNumQueries(2):
+			resp = self.client.get(url)
+		items = {(item['name'], item['unit']): (item['quantity'], item['recipes']) for item in resp.data['items']}
+		# "G" and "g" are merged
+		self.assertEqual(items, {
+			('arroz', 'g'): (7 * 250.0, 14),
+			('huevos', ''): (7 * 3.0, 14),
+			('pan', 'g'): (7 * 100.0, 7),
+			('sal', ''): (None, 14),
+		})
+
+		with self.assertNumQueries(1):
+			self.client.get(url)
+
+	def test_diet_slot_swap_updates_only_that_menu_slot(self):
+		from apps.diets.models import MenuRecipe
+
+		for name, meal in (('B1', 'B'), ('L1', 'L'), ('D1', 'D'), ('D2', 'D')):
+			Recipe.objects.create(name=name, description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+		excluded = Tag.objects.create(name='fish', description='fish')
+		fish = Recipe.objects.create(name='D3', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal='D', goal='N')
+		fish.tags.set([excluded])
+		self.user.tags.add(excluded)
+
+		self.client.force_authenticate(user=self.user)
+		diet_id = self.client.post(reverse('diet-api'), {}, format='json').data['id']
+		url = reverse('diet-slot', args=[diet_id])
+		before = dict(MenuRecipe.objects.filter(menu__diet_id=diet_id).values_list('id', 'recipe_id'))
+		dinner = MenuRecipe.objects.get(menu__diet_id=diet_id, menu__day=3, slot=2)
+
+		# diet with user and ideal, exclusions, catalog version, week slots, one update, recipe and its tags
+		with self.assertNumQueries(7):
+			resp = self.client.patch(url, {'day': 3, 'meal': 'D'}, format='json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertNotEqual(resp.data['recipe']['id'], dinner.recipe_id)
+		self.assertNotEqual(resp.data['recipe']['id'], fish.id)
+
+		after = dict(MenuRecipe.objects.filter(menu__diet_id=diet_id).values_list('id', 'recipe_id'))
+		changed = {row_id for row_id in before if before[row_id] != after[row_id]}
+		self.assertEqual(changed, {dinner.id})
+
+		# An explicit recipe must be eligible for the user and the meal
+		resp = self.client.patch(url, {'day': 3, 'meal': 'D', 'recipe': fish.id}, format='json')
+		self.assertEqual(resp.status_code, 400)
+		resp = self.client.patch(url, {'day': 3, 'meal': 'B', 'recipe': dinner.recipe_id}, format='json')
+		self.assertEqual(resp.status_code, 400)
+
+	def test_diet_slot_swap_weighs_favorites_and_rejects_missing_menus(self):
+		import numpy as np
+		from apps.diets.models import MenuRecipe
+		from apps.diets.api.serializers import DietSlotSerializer
+
+		for meal in 'BLD':
+			for i in range(10):
+				Recipe.objects.create(name=f'{meal}{i}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+		self.client.force_authenticate(user=self.user)
+		diet = Diet.objects.get(pk=self.client.post(reverse('diet-api'), {}, format='json').data['id'])
+		in_week = MenuRecipe.objects.filter(menu__diet=diet, slot=2).values_list('recipe_id', flat=True)
+		free = list(Recipe.objects.filter(meal='D').exclude(pk__in=list(in_week)).order_by('pk').values_list('pk', flat=True))
+		self.user.favorite_recipes.add(free[0])
+
+		# Same weights as generation: the favorite weighs 4 times the others
+		np.random.seed(0)
+		picks = []
+		for _ in range(60):
+			serializer = DietSlotSerializer(diet, data={'day': 1, 'meal': 'D'})
+			self.assertTrue(serializer.is_valid(), serializer.errors)
+			picks.append(serializer.validated_data['recipe'])
+		self.assertLessEqual(set(picks), set(free))
+		self.assertGreater(picks.count(free[0]), 30)
+
+		# A day without menu, as in some migrated diets, is a validation error
+		diet.menus.filter(day=7).delete()
+		resp = self.client.patch(reverse('diet-slot', args=[diet.pk]), {'day': 7, 'meal': 'D'}, format='json')
+		self.assertEqual((resp.status_code, list(resp.data)), (400, ['day']))
+
+	def test_multi_week_plan_is_one_request_with_variety_across_weeks(self):
+		from collections import Counter
+		from datetime import date
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+		from apps.diets.models import MenuRecipe
+
+		for meal in 'BLD':
+			for i in range(10):
+				Recipe.objects.create(name=f'{meal}{i}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+		self.client.force_authenticate(user=self.user)
+		url = reverse('diet-api')
+		# Build the recipe index outside the comparison
+		recipe_index.eligible_pools(['B'], [])
+
+		with CaptureQueriesContext(connection) as one_week:
+			self.client.post(url, {'startDate': '2030-01-07'}, format='json')
+		with CaptureQueriesContext(connection) as three_weeks:
+			resp = self.client.post(url, {'startDate': '2030-01-14', 'weeks': 3}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		# Same plan whatever the number of weeks
+		self.assertEqual(len(three_weeks), len(one_week))
+
+		self.assertEqual(
+			[(d['startDate'], d['endDate']) for d in resp.data],
+			[('2030-01-14', '2030-01-21'), ('2030-01-21', '2030-01-28'), ('2030-01-28', '2030-02-04')]
+		)
+		breakfasts = Counter(MenuRecipe.objects.filter(menu__diet_id__in=[d['id'] for d in resp.data], slot=0).values_list('recipe_id', flat=True))
+		# 21 breakfasts over 10 recipes: every recipe is used before any repeats
+		self.assertEqual(len(breakfasts), 10)
+		self.assertLessEqual(max(breakfasts.values()), 3)
+
+		# The whole range is checked against existing diets
+		resp = self.client.post(url, {'startDate': '2029-12-24', 'weeks': 3}, format='json')
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(Diet.objects.filter(user=self.user, startDate__lt=date(2030, 1, 7)).count(), 0)
+
+	def test_household_plan_shares_recipes_avoiding_every_members_exclusions(self):
+		from apps.diets.models import MenuRecipe, Ingredient
+		from apps.users.models import Household, Ideal
+
+		nut = Tag.objects.create(name='nut')
+		for meal in 'BLD':
+			for i in range(8):
+				Recipe.objects.create(name=f'{meal}{i}', description='x', ingredients=['arroz'], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+			Recipe.objects.create(name=f'{meal}-nut', description='x', ingredients=['arroz'], preparation_steps='x', nutritional_info={}, meal=meal, goal='N').tags.add(nut)
+			Recipe.objects.create(name=f'{meal}-egg', description='x', ingredients=['huevo'], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+		# Each member excludes something different, the shared plan avoids both
+		self.admin.tags.add(nut)
+		self.user.excluded_ingredients.add(Ingredient.objects.get(name='huevo'))
+
+		self.client.force_authenticate(user=self.user)
+		resp = self.client.post(reverse('household-list-create'), {'name': 'Casa', 'invite': ['admin@example.com']}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		# Unknown emails get the same answer, registered ones are not revealed
+		unknown = self.client.post(reverse('household-list-create'), {'name': 'Casa', 'invite': ['nobody@example.com']}, format='json')
+		self.assertEqual((unknown.status_code, unknown.data['members']), (201, resp.data['members']))
+		household = Household.objects.get(pk=resp.data['id'])
+		# Invited users only join by accepting
+		self.assertEqual(set(household.members.all()), {self.user})
+		self.client.force_authenticate(user=self.admin)
+		self.assertEqual([h['id'] for h in self.client.get(reverse('household-invitation-list')).data], [household.pk])
+		self.assertEqual(self.client.post(reverse('household-invitation', args=[household.pk])).status_code, 200)
+		self.assertEqual(set(household.members.all()), {self.user, self.admin})
+		self.assertEqual(self.client.get(reverse('household-invitation-list')).data, [])
+		self.assertEqual(self.client.post(reverse('household-invitation', args=[unknown.data['id']])).status_code, 404)
+		self.client.force_authenticate(user=self.user)
+
+		url = reverse('household-diets', args=[household.pk])
+		resp = self.client.post(url, {'startDate': '2030-01-07', 'weeks': 2}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual(len(resp.data), 4)
+
+		diets = Diet.objects.filter(household=household)
+		self.assertEqual(diets.count(), 4)
+		self.assertEqual({diet.user_id for diet in diets}, {self.user.pk, self.admin.pk})
+		for start in ('2030-01-07', '2030-01-14'):
+			weeks = [
+				list(MenuRecipe.objects.filter(menu__diet=diet).order_by('menu__day', 'slot').values_list('recipe__name', flat=True))
+				for diet in diets.filter(startDate=start)
+			]
+			self.assertEqual(len(weeks[0]), 21)
+			self.assertEqual(weeks[0], weeks[1])
+			self.assertFalse([name for name in weeks[0] if '-' in name])
+
+		# Any busy member blocks the household plan
+		resp = self.client.post(url, {'startDate': '2030-01-14'}, format='json')
+		self.assertEqual(resp.status_code, 400)
+		# Only members can plan for a household
+		outsider = User.objects.create_user(email='out@example.com', password='x', first_name='O', last_name='U', age=30, height=170, weight=70, ideal=Ideal.objects.create(goal='N'))
+		self.client.force_authenticate(user=outsider)
+		self.assertEqual(self.client.post(url, {'startDate': '2031-01-06'}, format='json').status_code, 404)
+		self.assertEqual(self.client.delete(reverse('household-member-delete', args=[household.pk, self.user.pk])).status_code, 404)
+
+		# A member can leave, their upcoming household diets go with them
+		self.client.force_authenticate(user=self.admin)
+		self.assertEqual(self.client.delete(reverse('household-member-delete', args=[household.pk, self.admin.pk])).status_code, 204)
+		self.assertFalse(Diet.objects.filter(user=self.admin, household=household).exists())
+		self.assertEqual(Diet.objects.filter(user=self.user, household=household).count(), 2)
+		self.assertEqual(self.client.post(url, {'startDate': '2031-01-06'}, format='json').status_code, 404)
+		# and is left out of the next plans
+		self.client.force_authenticate(user=self.user)
+		resp = self.client.post(url, {'startDate': '2031-01-06'}, format='json')
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual({diet['id'] for diet in resp.data}, set(Diet.objects.filter(startDate='2031-01-06').values_list('pk', flat=True)))
+		self.assertFalse(Diet.objects.filter(user=self.admin, startDate='2031-01-06').exists())
+		self.assertEqual(self.client.delete(reverse('household-member-delete', args=[household.pk, outsider.pk])).status_code, 404)
+
+		# The last member leaving deletes the household
+		self.assertEqual(self.client.delete(reverse('household-member-delete', args=[household.pk, self.user.pk])).status_code, 204)
+		self.assertFalse(Household.objects.filter(pk=household.pk).exists())
+
+	def test_similar_recipes_rank_by_tags_meal_and_nutrients(self):
+		from apps.diets.models import Ingredient
+
+		veg = Tag.objects.create(name='veg')
+		spicy = Tag.objects.create(name='spicy')
+		info = {'calories': 500, 'protein': 25, 'carbs': 60, 'fat': 15}
+		seed = Recipe.objects.create(name='seed', description='x', ingredients=['arroz'], preparation_steps='x', nutritional_info=info, meal='L', goal='N')
+		seed.tags.set([veg, spicy])
+		twin = Recipe.objects.create(name='twin', description='x', ingredients=['arroz'], preparation_steps='x', nutritional_info=info, meal='L', goal='N')
+		twin.tags.set([veg, spicy])
+		close = Recipe.objects.create(name='close', description='x', ingredients=['huevo'], preparation_steps='x', nutritional_info=info, meal='L', goal='N')
+		close.tags.set([veg])
+		Recipe.objects.create(name='far', description='x', ingredients=[], preparation_steps='x', nutritional_info={'calories': 150}, meal='B', goal='G')
+
+		url = reverse('recipe-similar', args=[seed.id])
+		self.client.force_authenticate(user=self.user)
+		resp = self.client.get(url)
+		self.assertEqual([r['name'] for r in resp.data], ['twin', 'close', 'far'])
+		self.assertAlmostEqual(resp.data[0]['similarity'], 1.0, places=3)
+
+		self.assertEqual([r['name'] for r in self.client.get(url, {'k': 1}).data], ['twin'])
+		# Invalid sizes fall back to the default instead of failing
+		for k in ('inf', '-inf', 'nan', '1e400', '2.5'):
+			resp = self.client.get(url, {'k': k})
+			self.assertEqual(resp.status_code, 200)
+			self.assertEqual(len(resp.data), 3)
+		self.assertEqual([r['name'] for r in self.client.get(url, {'meal': 'B'}).data], ['far'])
+
+		# The user's exclusions apply, and only the returned recipes are queried:
+		# seed check, exclusions, catalog version, recipes and their tags
+		self.user.excluded_ingredients.add(Ingredient.objects.get(name='huevo'))
+		with self.assertNumQueries(5):
+			resp = self.client.get(url, {'k': 'many'})
+		self.assertEqual([r['name'] for r in resp.data], ['twin', 'far'])
+
+		self.assertEqual(self.client.get(reverse('recipe-similar', args=[0])).status_code, 404)
+
+	def test_ratings_keep_denormalized_counters_in_one_batch(self):
+		from django.db import connection
+		from django.test.utils import CaptureQueriesContext
+
+		recipes = [
+			Recipe.objects.create(name=f'R{i}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+			for i in range(22)
+		]
+		stale = Recipe.objects.get(pk=recipes[0].pk)
+		url = reverse('rating-list-create')
+		self.client.force_authenticate(user=self.user)
+
+		# A burst costs the same queries as a single rating
+		with CaptureQueriesContext(connection) as one:
+			self.client.post(url, {'recipe': recipes[0].id, 'score': 5}, format='json')
+		burst = [{'recipe': recipe.id, 'score': 2} for recipe in recipes[1:]]
+		with CaptureQueriesContext(connection) as many:
+			resp = self.client.post(url, burst, format='json')
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual(len(many), len(one))
+
+		# Rating again replaces the score, another user adds to the counters
+		self.client.post(url, [{'recipe': recipes[0].id, 'score': 3}], format='json')
+		self.client.force_authenticate(user=self.admin)
+		self.client.post(url, {'recipe': recipes[0].id, 'score': 4}, format='json')
+		# Saving a recipe loaded earlier does not write back its old counters
+		stale.name = 'R0'
+		stale.save()
+
+		recipes[0].refresh_from_db()
+		self.assertEqual((recipes[0].rating_count, recipes[0].rating_sum, recipes[0].rating_average), (2, 7, 3.5))
+		# The sync feed sees the new average
+		self.assertGreater(Recipe.objects.get(pk=recipes[1].pk).updated_at, recipes[1].updated_at)
+		self.assertEqual(len(self.client.get(url).data), 1)
+
+		Recipe.objects.create(name='unrated', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+		resp = self.client.get(reverse('recipe-list-create'), {'ordering': 'rating', 'page_size': 2})
+		self.assertEqual([(r['name'], r['rating_average']) for r in resp.json()['results']], [('R0', 3.5), ('R21', 2.0)])
+		resp = self.client.get(resp.json()['next'])
+		self.assertEqual([r['name'] for r in resp.json()['results']], ['R20', 'R19'])
+
+		resp = self.client.post(url, [{'recipe': 0, 'score': 3}], format='json')
+		self.assertEqual(resp.status_code, 400)
+		self.assertEqual(self.client.post(url, {'recipe': recipes[1].id, 'score': 6}, format='json').status_code, 400)
 
+		# Deleting a user takes their ratings out of the counters
+		self.admin.delete()
+		recipes[0].refresh_from_db()
+		self.assertEqual((recipes[0].rating_count, recipes[0].rating_sum), (1, 3))
+
+	def test_favorites_are_managed_by_api_and_come_up_more_often(self):
+		import numpy as np
+		from apps.diets.utils import generate_week_recipes
+
+		recipes = [
+			Recipe.objects.create(name=f'{meal}{i}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+			for meal in 'BLD' for i in range(30)
+		]
+		favorite = recipes[0]
+		url = reverse('favorite-recipes')
+		self.client.force_authenticate(user=self.user)
+
+		resp = self.client.post(url, {'recipes': [favorite.id, favorite.id]}, format='json')
+		self.assertEqual((resp.status_code, resp.data), (201, {'recipes': [favorite.id]}))
+		resp = self.client.post(url, {'recipes': [0]}, format='json')
+		self.assertEqual((resp.status_code, list(resp.data)), (400, ['recipes']))
+		self.assertEqual([r['name'] for r in self.client.get(url).data], ['B0'])
+
+		# The same seeded draws land on the favorite more often once it is pinned
+		def weeks_with(favorite_ids):
+			np.random.seed(0)
+			return sum(favorite.id in generate_week_recipes(self.user, [], favorite_ids=favorite_ids) for _ in range(100))
+		self.assertGreater(weeks_with([favorite.id]), weeks_with([]) + 20)
+
+		resp = self.client.delete(reverse('favorite-recipe-delete', args=[favorite.id]))
+		self.assertEqual(resp.status_code, 204)
+		self.assertEqual(self.client.get(url).data, [])
+
+	def test_tag_bulk_upsert_updates_existing_names_in_one_query(self):
+		existing = Tag.objects.create(name='egg', description='old')
+		url = reverse('tag-list-create') + '?upsert=true'
+		self.client.force_authenticate(user=self.admin)
+
+		payload = [
+			{'name': 'egg', 'description': 'new'},
+			{'name': 'milk', 'description': 'milk'},
+		]
+		# One INSERT ... ON CONFLICT for the whole batch, the existing name does not fail
+		with self.assertNumQueries(1):
+			resp = self.client.post(url, payload, format='json')
+		self.assertEqual(resp.status_code, 201)
+
+		self.assertEqual(Tag.objects.count(), 2)
+		existing.refresh_from_db()
+		self.assertEqual(existing.description, 'new')
+		ids = {tag['name']: tag['id'] for tag in resp.data}
+		self.assertEqual(ids, dict(Tag.objects.values_list('name', 'id')))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
 class DietsSerializerLogicTests(TestCase):
 		"""Tests focused on serializer/business logic (no auth checks).
 
@@ -116,6 +627,7 @@ class DietsSerializerLogicTests(TestCase):
 				first_name='Biz', last_name='Logic', age=28, height=170, weight=68,
 				ideal=user_ideal
 			)
+			recipe_index.invalidate()
    
         # ---------- TEST CASES ----------
 
@@ -202,3 +714,400 @@ class DietsSerializerLogicTests(TestCase):
 					all_recipe_names.add(recipe.name)
 
 			self.assertNotIn('B_bad', all_recipe_names)
+
+		def test_diet_serializer_create_runs_constant_number_of_queries(self):
+			from apps.diets.api.serializers import DietSerializer
+
+			for idx in range(10):
+				for meal in ('B', 'L', 'D'):
+					Recipe.objects.create(name=f'{meal}{idx}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+
+			# Warm the recipe index so generation does not touch the catalog
+			recipe_index.eligible_pools(['B'], [])
+
+			# Fresh instance so the ideal is not cached from setUp
+			user = User.objects.get(pk=self.user.pk)
+
+			# Favorites load with the exclusions, generation keeps its queries
+			user.favorite_recipes.add(Recipe.objects.first())
+
+			# ideal, user preferences, catalog version, savepoint, diet, menus, menu slots, recent recipes, release
+			with self.assertNumQueries(9):
+				diet = DietSerializer().create({'user': user})
+
+			self.assertEqual(diet.menus.count(), 7)
+			for menu in diet.menus.all():
+				self.assertEqual(menu.recipes.count(), 3)
+
+		def test_recipe_index_follows_writes_of_every_process(self):
+			from apps.diets.catalog import bump_catalog_version
+
+			tag = Tag.objects.create(name='nuts', description='n')
+			recipe = Recipe.objects.create(name='B_nuts', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+
+			pools = recipe_index.eligible_pools(['B'], [tag.id], 'N')
+			self.assertEqual(pools['B'], [recipe.id])
+			# Same catalog version, the index is not rebuilt
+			with self.assertNumQueries(1):
+				recipe_index.eligible_pools(['B'], [tag.id], 'N')
+
+			# Tag the recipe and add a new one: this process patches its index
+			# and follows its own bumps, only the version is read
+			with self.captureOnCommitCallbacks(execute=True):
+				recipe.tags.add(tag)
+				other = Recipe.objects.create(name='B_plain', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+
+			with self.assertNumQueries(1):
+				pools = recipe_index.eligible_pools(['B', 'L'], [tag.id], 'N')
+			self.assertEqual(pools, {'B': [other.id], 'L': []})
+
+			# A write made by another worker only moves the shared version
+			Recipe.objects.filter(pk=other.pk).update(meal='L')
+			bump_catalog_version()
+			pools = recipe_index.eligible_pools(['B', 'L'], [tag.id], 'N')
+			self.assertEqual(pools, {'B': [], 'L': [other.id]})
+
+			with self.captureOnCommitCallbacks(execute=True):
+				other.delete()
+			with self.assertNumQueries(1):
+				self.assertEqual(recipe_index.eligible_pools(['B'], [], 'N')['B'], [recipe.id])
+
+		def test_recipe_index_excludes_tags_beyond_the_first_packed_byte(self):
+			tags = [Tag.objects.create(name=f'tag{i}', description='t') for i in range(12)]
+			tagged = Recipe.objects.create(name='L_tagged', description='l', ingredients=[], preparation_steps='x', nutritional_info={}, meal='L', goal='N')
+			tagged.tags.set(tags[10:])
+			plain = Recipe.objects.create(name='L_plain', description='l', ingredients=[], preparation_steps='x', nutritional_info={}, meal='L', goal='N')
+			plain.tags.set(tags[:2])
+
+			pools = recipe_index.eligible_pools(['L'], [tags[11].id], 'N')
+			self.assertEqual(pools['L'], [plain.id])
+
+			pools = recipe_index.eligible_pools(['L'], [tags[1].id], None)
+			self.assertEqual(pools['L'], [tagged.id])
+
+		def test_nutrition_mode_picks_recipes_close_to_the_daily_target(self):
+			from apps.diets.optimizer import daily_target, MEAL_SHARES
+
+			target = daily_target(self.user)
+			good = {}
+			for share, meal in zip(MEAL_SHARES, ('B', 'L', 'D')):
+				info = dict(zip(['calories', 'protein', 'carbs', 'fat'], (float(v) for v in target * share)))
+				good[meal] = Recipe.objects.create(name=f'{meal}_fit', description='x', ingredients=[], preparation_steps='x', nutritional_info=info, meal=meal, goal='N')
+				# Far off the target in both directions
+				Recipe.objects.create(name=f'{meal}_huge', description='x', ingredients=[], preparation_steps='x', nutritional_info={'calories': 5000, 'protein': 300, 'carbs': 600, 'fat': 250}, meal=meal, goal='N')
+				Recipe.objects.create(name=f'{meal}_tiny', description='x', ingredients=[], preparation_steps='x', nutritional_info={'calories': '20 kcal'}, meal=meal, goal='N')
+
+			client = APIClient()
+			client.force_authenticate(user=self.user)
+			resp = client.post(reverse('diet-api'), {'mode': 'nutrition'}, format='json')
+			self.assertEqual(resp.status_code, 201, resp.data)
+
+			diet = Diet.objects.get(user=self.user)
+			names = {recipe.name for menu in diet.menus.all() for recipe in menu.recipes.all()}
+			self.assertEqual(names, {'B_fit', 'L_fit', 'D_fit'})
+
+		def test_optimize_week_fills_every_slot_of_a_10k_recipes_catalog(self):
+			import numpy as np
+			from apps.diets.optimizer import daily_target, optimize_week
+
+			rng = np.random.default_rng(0)
+			pools = {}
+			for offset, meal in enumerate(('B', 'L', 'D')):
+				ids = np.arange(offset * 4000, offset * 4000 + 3334)
+				nutrients = rng.uniform([100, 5, 10, 2], [1200, 60, 150, 50], size=(len(ids), 4)).astype(np.float32)
+				pools[meal] = (ids, nutrients)
+
+			# Latency is measured by the benchmark_eligibility command
+			week = optimize_week(pools, daily_target(self.user), rng)
+			self.assertEqual(len(week), 21)
+			self.assertTrue(all(recipe_id in pools[meal][0] for recipe_id, meal in zip(week, ('B', 'L', 'D') * 7)))
+
+		def test_similar_follows_tag_changes(self):
+			import numpy as np
+
+			base = Recipe.objects.create(name='base', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='D', goal='N')
+			other = Recipe.objects.create(name='other', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='D', goal='N')
+			third = Recipe.objects.create(name='third', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='D', goal='N')
+			fish = Tag.objects.create(name='fish', description='f')
+			recipe_index.similar([base.id])
+
+			# Tagging and editing update the rows and their norms in place
+			with self.captureOnCommitCallbacks(execute=True):
+				base.tags.add(fish)
+				third.tags.add(fish)
+				other.nutritional_info = {'calories': 900}
+				other.save()
+			with self.assertNumQueries(1):
+				ranked = recipe_index.similar([base.id])
+			self.assertEqual([recipe_id for recipe_id, _ in ranked], [third.id, other.id])
+			stored = recipe_index._norms.copy()
+			recipe_index.invalidate()
+			recipe_index.similar([base.id])
+			self.assertTrue(np.allclose(stored, recipe_index._norms))
+
+		def test_random_mode_favours_better_rated_recipes(self):
+			from apps.diets.utils import _shuffled, rate_recipes
+
+			good = Recipe.objects.create(name='good', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+			bad = Recipe.objects.create(name='bad', description='b', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+			recipe_index.eligible_ratings(['B'], [])
+
+			# The index follows the counters without rebuilding, only the
+			# catalog version is read
+			with self.captureOnCommitCallbacks(execute=True):
+				rate_recipes(self.user, {good.id: 5, bad.id: 1})
+			with self.assertNumQueries(1):
+				ids, weights = recipe_index.eligible_ratings(['B'], [])['B']
+			weights = dict(zip(ids.tolist(), weights.tolist()))
+			# Smoothed towards 3: (5 + 3 * 2) / 3 and (1 + 3 * 2) / 3
+			self.assertAlmostEqual(weights[good.id], 11 / 3, places=5)
+			self.assertAlmostEqual(weights[bad.id], 7 / 3, places=5)
+
+			# The heavier recipe is popped first most of the time
+			first = [_shuffled(['a', 'b'], set(), [1, 100])[-1] for _ in range(200)]
+			self.assertGreater(first.count('b'), 180)
+			# Recent recipes still come last whatever their weight
+			self.assertEqual(_shuffled(['a', 'b'], {'b'}, [1, 100]), ['b', 'a'])
+
+		def test_catalog_version_is_a_row_bumped_in_sql(self):
+			from apps.diets.catalog import catalog_version, bump_catalog_version
+			from apps.diets.models import CatalogVersion
+
+			version = catalog_version()
+			# The increment is computed by the database, never read and written back
+			with self.assertNumQueries(4) as queries:
+				self.assertEqual(bump_catalog_version(), version + 1)
+			self.assertIn('"version" + 1', ' '.join(query['sql'] for query in queries.captured_queries))
+			self.assertEqual(bump_catalog_version(), version + 2)
+
+			# A lost row is recreated from the clock, past every earlier version
+			CatalogVersion.objects.all().delete()
+			self.assertGreater(bump_catalog_version(), version + 2)
+
+		def test_shared_cache_check_warns_about_process_local_backends(self):
+			from apps.diets.checks import check_shared_cache
+
+			# This class runs on LOCAL_CACHES
+			self.assertEqual([warning.id for warning in check_shared_cache(None)], ['diets.W001'])
+			shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'nutrimate_cache'}}
+			with override_settings(CACHES=shared):
+				self.assertEqual(check_shared_cache(None), [])
+
+		def test_pregenerate_diets_command_skips_busy_users_and_resumes(self):
+			import os
+			import tempfile
+			from datetime import date
+			from django.core.management import call_command
+			from apps.users.models import Ideal
+
+			for meal in ('B', 'L', 'D'):
+				Recipe.objects.create(name=f'{meal}1', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+
+			other = User.objects.create_user(
+				email='other@example.com', password='pw', first_name='O', last_name='U',
+				age=30, height=170, weight=70, ideal=Ideal.objects.create(goal='N')
+			)
+			# self.user already has a diet overlapping the target week
+			Diet.objects.create(user=self.user, startDate=date(2030, 1, 5), endDate=date(2030, 1, 12))
+
+			checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+			call_command('pregenerate_diets', start_date=date(2030, 1, 7), workers=0, shard_size=1, checkpoint=checkpoint, stdout=open(os.devnull, 'w'))
+
+			diet = Diet.objects.get(user=other)
+			self.assertEqual((diet.startDate, diet.endDate), (date(2030, 1, 7), date(2030, 1, 14)))
+			self.assertEqual(diet.menus.count(), 7)
+			self.assertEqual(Diet.objects.filter(user=self.user).count(), 1)
+
+			# Every shard is checkpointed, a second run has nothing left to do
+			with self.assertNumQueries(1):
+				call_command('pregenerate_diets', start_date=date(2030, 1, 7), workers=0, shard_size=1, checkpoint=checkpoint, stdout=open(os.devnull, 'w'))
+			self.assertEqual(Diet.objects.count(), 2)
+
+		def test_diet_response_keeps_day_and_meal_order(self):
+			for meal in ('D', 'L', 'B'):
+				Recipe.objects.create(name=f'{meal}1', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+
+			client = APIClient()
+			client.force_authenticate(user=self.user)
+			resp = client.post(reverse('diet-api'), {}, format='json')
+			self.assertEqual(resp.status_code, 201, resp.data)
+
+			self.assertEqual([menu['day'] for menu in resp.data['menus']], list(range(1, 8)))
+			for menu in resp.data['menus']:
+				self.assertEqual([recipe['meal'] for recipe in menu['detailed_recipes']], ['B', 'L', 'D'])
+
+			# Menus belong to their diet and go away with it
+			Diet.objects.get(pk=resp.data['id']).delete()
+			self.assertFalse(Menu.objects.exists())
+
+		def test_purge_diets_command_deletes_orphans_and_old_diets_in_chunks(self):
+			import io
+			from datetime import date, timedelta
+			from django.core.management import call_command
+			from apps.diets.models import MenuRecipe
+
+			recipe = Recipe.objects.create(name='B1', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal='B', goal='N')
+			# Three menus left behind by diets deleted before menus had a diet FK
+			for day in range(1, 4):
+				MenuRecipe.objects.create(menu=Menu.objects.create(day=day), slot=0, recipe=recipe)
+
+			today = date.today()
+			old = Diet.objects.create(user=self.user, startDate=today - timedelta(days=400), endDate=today - timedelta(days=393))
+			MenuRecipe.objects.create(menu=Menu.objects.create(diet=old, day=1), slot=0, recipe=recipe)
+			recent = Diet.objects.create(user=self.user, startDate=today, endDate=today + timedelta(days=7))
+			MenuRecipe.objects.create(menu=Menu.objects.create(diet=recent, day=1), slot=0, recipe=recipe)
+
+			out = io.StringIO()
+			call_command('purge_diets', retention_days=365, chunk_size=2, stdout=out)
+
+			self.assertEqual(list(Diet.objects.all()), [recent])
+			self.assertEqual(Menu.objects.count(), 1)
+			self.assertEqual(MenuRecipe.objects.count(), 1)
+			self.assertIn('diets_menu: 4 rows deleted', out.getvalue())
+			self.assertIn('diets_menurecipe: 4 rows deleted', out.getvalue())
+			self.assertIn('diets_diet: 1 rows deleted', out.getvalue())
+
+		def test_import_recipes_command_inserts_in_chunks_and_reports_bad_rows(self):
+			import io
+			import os
+			import json
+			import tempfile
+			from django.core.management import call_command
+
+			tag = Tag.objects.create(name='nuts', description='nuts')
+			row = {
+				'name': 'R', 'description': 'r', 'ingredients': ['x'], 'preparation_steps': 'do',
+				'nutritional_info': {'calories': 100}, 'meal': 'B', 'goal': 'N', 'tags': [tag.id]
+			}
+			lines = [json.dumps({**row, 'name': f'R{i}'}) for i in range(4)]
+			lines.insert(1, '{not json')
+			lines.insert(3, json.dumps({**row, 'meal': 'X'}))
+			lines.append(json.dumps({**row, 'tags': [tag.id + 100]}))
+
+			with tempfile.TemporaryDirectory() as tmp:
+				path = os.path.join(tmp, 'recipes.ndjson')
+				with open(path, 'w') as f:
+					f.write('\n'.join(lines))
+
+				out, err = io.StringIO(), io.StringIO()
+				# 1 tag id load, then per chunk with valid rows: savepoint, recipes, tag rows,
+				# ingredient names, ingredient ids, recipe ingredients, release.
+				# The last chunk only holds a rejected row and writes nothing.
+				with self.assertNumQueries(1 + 2 * 7):
+					call_command('import_recipes', path, chunk_size=3, stdout=out, stderr=err)
+
+				self.assertEqual(sorted(Recipe.objects.values_list('name', flat=True)), ['R0', 'R1', 'R2', 'R3'])
+				self.assertEqual(Recipe.tags.through.objects.filter(tag=tag).count(), 4)
+				self.assertIn('line 2:', err.getvalue())
+				self.assertIn('line 4:', err.getvalue())
+				self.assertIn('line 7:', err.getvalue())
+				self.assertIn('4 recipes imported, 3 rows rejected', out.getvalue())
+
+				csv_path = os.path.join(tmp, 'recipes.csv')
+				with open(csv_path, 'w', newline='') as f:
+					f.write('name,description,ingredients,preparation_steps,nutritional_info,meal,goal,tags\n')
+					f.write(f'C1,c,"[""x""]",do,"{{""calories"": 10}}",L,N,{tag.id}\n')
+				call_command('import_recipes', csv_path, stdout=out, stderr=err)
+				self.assertEqual(list(Recipe.objects.get(name='C1').tags.all()), [tag])
+
+		def test_ingredients_are_normalized_and_excluded_from_generation(self):
+			from apps.diets.models import Ingredient, RecipeIngredient
+			from apps.diets.api.serializers import DietSerializer
+			from rest_framework.test import APIRequestFactory
+
+			def recipe(name, meal, ingredients):
+				return Recipe.objects.create(
+					name=name, description='x', ingredients=ingredients, preparation_steps='x',
+					nutritional_info={}, meal=meal, goal='N'
+				)
+
+			peanut_toast = recipe('PB', 'B', ['2 rebanadas de pan', '30 g de Maní'])
+			oats = recipe('OA', 'B', [{'name': 'Avena', 'quantity': 50, 'unit': 'g'}])
+			recipe('L1', 'L', ['arroz'])
+			recipe('D1', 'D', ['pollo'])
+
+			peanut = Ingredient.objects.get(name='maní')
+			self.assertEqual(
+				RecipeIngredient.objects.filter(recipe=peanut_toast, ingredient=peanut).values_list('quantity', 'unit').get(),
+				(30.0, 'g')
+			)
+
+			# Editing the JSON resyncs the rows
+			oats.ingredients = ['avena', 'maní']
+			oats.save()
+			self.assertEqual(set(peanut.recipe_ingredients.values_list('recipe__name', flat=True)), {'PB', 'OA'})
+			oats.ingredients = ['avena']
+			oats.save()
+
+			# Saves that leave the JSON alone keep the rows, in-place edits resync them
+			from django.db import connection
+			from django.test.utils import CaptureQueriesContext
+			oats = Recipe.objects.get(pk=oats.pk)
+			oats.name = 'OA'
+			with CaptureQueriesContext(connection) as queries:
+				oats.save()
+			self.assertFalse([q for q in queries if 'diets_recipeingredient' in q['sql']])
+			oats.ingredients.append('maní')
+			oats.save(update_fields=['name'])
+			self.assertEqual(peanut.recipe_ingredients.filter(recipe=oats).count(), 0)
+			oats.save()
+			self.assertEqual(peanut.recipe_ingredients.filter(recipe=oats).count(), 1)
+			oats.ingredients = ['avena']
+			oats.save()
+
+			self.user.excluded_ingredients.add(peanut)
+			request = APIRequestFactory().post('/')
+			request.user = self.user
+			serializer = DietSerializer(data={}, context={'request': request})
+			self.assertTrue(serializer.is_valid(), serializer.errors)
+			with self.captureOnCommitCallbacks(execute=True):
+				diet = serializer.save(user=self.user)
+
+			breakfasts = set(Recipe.objects.filter(menu_slots__menu__diet=diet, meal='B').values_list('name', flat=True))
+			self.assertEqual(breakfasts, {'OA'})
+
+		def test_nutrient_columns_follow_nutritional_info_and_sum_in_sql(self):
+			from django.db.models import Sum
+			from apps.diets.utils import bulk_create_recipes
+
+			light = Recipe.objects.create(
+				name='Light', description='x', ingredients=[], preparation_steps='x',
+				nutritional_info={'calories': '350 kcal', 'protein': 20}, meal='B', goal='N'
+			)
+			self.assertEqual((light.calories, light.protein, light.carbs), (350.0, 20.0, None))
+
+			light.nutritional_info = {'calories': 300}
+			light.save(update_fields=['nutritional_info'])
+			light.refresh_from_db()
+			self.assertEqual((light.calories, light.protein), (300.0, None))
+
+			bulk_create_recipes([{
+				'name': 'Heavy', 'description': 'x', 'ingredients': [], 'preparation_steps': 'x',
+				'nutritional_info': {'calories': 900, 'fat': '40,5 g'}, 'meal': 'B', 'goal': 'N', 'tags': []
+			}])
+			self.assertEqual(Recipe.objects.get(name='Heavy').fat, 40.5)
+			self.assertEqual(Recipe.objects.aggregate(total=Sum('calories'))['total'], 1200.0)
+			self.assertEqual(list(Recipe.objects.filter(meal='B', calories__lte=500)), [light])
+
+		def test_recent_recipes_are_skipped_in_the_following_week(self):
+			from datetime import date
+			from apps.diets.api.serializers import DietSerializer
+			from apps.diets.models import MenuRecipe
+
+			for idx in range(14):
+				for meal in ('B', 'L', 'D'):
+					Recipe.objects.create(name=f'{meal}{idx}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+
+			first = DietSerializer().create({'user': self.user, 'startDate': date(2030, 1, 7)})
+			second = DietSerializer().create({'user': self.user, 'startDate': date(2030, 1, 14)})
+
+			def recipes(diet):
+				return set(MenuRecipe.objects.filter(menu__diet=diet).values_list('recipe_id', flat=True))
+
+			# 14 recipes per meal: the second week only uses the 7 the first one did not
+			self.assertEqual(len(recipes(first)), 21)
+			self.assertFalse(recipes(first) & recipes(second))
+
+			self.user.refresh_from_db()
+			self.assertEqual([week['start'] for week in self.user.recent_recipes], ['2030-01-07', '2030-01-14'])
+			self.assertEqual(set(self.user.recent_recipes[1]['recipes']), recipes(second))
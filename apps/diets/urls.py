@@ -1,5 +1,5 @@
 from django.urls import path
-from .api.api import DietCreateAPIView, DietDeleteAPIView, RecipeListCreateAPIView, TagListCreateAPIView, RecipeDeleteAPIView, TagDeleteAPIView
+from .api.api import DietCreateAPIView, DietDeleteAPIView, RecipeListCreateAPIView, TagListCreateAPIView, RecipeDeleteAPIView, TagDeleteAPIView, CatalogChangesAPIView, IngredientListAPIView, DietSummaryAPIView, DietShoppingListAPIView, DietSlotAPIView, HouseholdDietCreateAPIView, RecipeSimilarAPIView, RatingListCreateAPIView
 
 
 urlpatterns = [
@@ -7,6 +7,14 @@ urlpatterns = [
     path('tags/<int:pk>/', TagDeleteAPIView.as_view(), name='tag-delete'),
     path('recipes/', RecipeListCreateAPIView.as_view(), name='recipe-list-create'),
     path('recipes/<int:pk>/', RecipeDeleteAPIView.as_view(), name='recipe-delete'),
+    path('recipes/<int:pk>/similar/', RecipeSimilarAPIView.as_view(), name='recipe-similar'),
+    path('ratings/', RatingListCreateAPIView.as_view(), name='rating-list-create'),
+    path('ingredients/', IngredientListAPIView.as_view(), name='ingredient-list'),
+    path('changes/', CatalogChangesAPIView.as_view(), name='catalog-changes'),
     path('diets/', DietCreateAPIView.as_view(), name='diet-api'),
-    path('diets/<int:pk>/', DietDeleteAPIView.as_view(), name='diet-delete')
+    path('households/<int:pk>/diets/', HouseholdDietCreateAPIView.as_view(), name='household-diets'),
+    path('diets/<int:pk>/', DietDeleteAPIView.as_view(), name='diet-delete'),
+    path('diets/<int:pk>/slots/', DietSlotAPIView.as_view(), name='diet-slot'),
+    path('diets/<int:pk>/summary/', DietSummaryAPIView.as_view(), name='diet-summary'),
+    path('diets/<int:pk>/shopping-list/', DietShoppingListAPIView.as_view(), name='diet-shopping-list')
 ]
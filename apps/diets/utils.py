@@ -0,0 +1,587 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from apps.diets.models import (
+    Diet, Menu, MenuRecipe, Recipe, Meal, Ingredient, RecipeIngredient, Rating, NUTRIENT_KEYS, parse_ingredients
+)
+from apps.diets.catalog import recipe_index, catalog_changed
+from Nutrimate.core.enums import GenerationMode
+from datetime import timedelta
+import numpy as np
+import random
+
+
+# Order of the meals inside each day of a generated week, its index is MenuRecipe.slot
+MEAL_ORDER = [Meal.BREAKFAST, Meal.LUNCH, Meal.DINNER]
+
+# Planned weeks kept in User.recent_recipes
+RECENT_WEEKS = 4
+
+# Favorite recipes weigh this many times their rating weight in random generation
+FAVORITE_WEIGHT = 4
+
+# user_preferences() entry of a user without any preference
+NO_PREFERENCES = ((), (), ())
+
+
+def diet_period(start_date):
+    """Return the (startDate, endDate) of a diet starting on start_date.
+
+    endDate is the first day after the week, so consecutive diets share it as
+    the next startDate.
+    """
+    return start_date, start_date + timedelta(days=7)
+
+
+def overlapping_diets(start_date, end_date):
+    """Diets that overlap the period [start_date, end_date).
+
+    A user may only have one diet per period, callers filter the result by user.
+    """
+    return Diet.objects.filter(startDate__lt=end_date, endDate__gt=start_date)
+
+
+def user_preferences(user_ids):
+    """Load the tags and ingredients each user wants to avoid and their favorite recipes with one query.
+
+    Args:
+        user_ids: Ids of the users to load.
+
+    Returns:
+        A dict {user_id: ([tag_id, ...], [ingredient_id, ...], [recipe_id, ...])};
+        users without any preference are missing, see NO_PREFERENCES.
+    """
+    from apps.users.models import User
+
+    tags = (
+        User.tags.through.objects.filter(user_id__in=user_ids)
+        .annotate(kind=Value(0, output_field=IntegerField()))
+        .values_list('user_id', 'tag_id', 'kind')
+    )
+    ingredients = (
+        User.excluded_ingredients.through.objects.filter(user_id__in=user_ids)
+        .annotate(kind=Value(1, output_field=IntegerField()))
+        .values_list('user_id', 'ingredient_id', 'kind')
+    )
+    favorites = (
+        User.favorite_recipes.through.objects.filter(user_id__in=user_ids)
+        .annotate(kind=Value(2, output_field=IntegerField()))
+        .values_list('user_id', 'recipe_id', 'kind')
+    )
+    preferences = {}
+    for user_id, related_id, kind in tags.union(ingredients, favorites, all=True):
+        preferences.setdefault(user_id, ([], [], []))[kind].append(related_id)
+    return preferences
+
+
+def get_eligible_pools(user_tag_ids, goal=None, ingredient_ids=()):
+    """Return the recipe ids a user can eat, grouped by meal.
+
+    Eligibility is resolved against the in-memory recipe index, so once the
+    index is warm this does not query the catalog.
+
+    Args:
+        user_tag_ids: Ids of the tags the user wants to avoid.
+        goal (str): Optional goal code used to filter the recipes.
+        ingredient_ids: Ids of the ingredients the user wants to avoid.
+
+    Returns:
+        A dict {meal: [recipe_id, ...]} with one entry per meal in MEAL_ORDER.
+    """
+    return recipe_index.eligible_pools(MEAL_ORDER, user_tag_ids, goal, ingredient_ids)
+
+
+def recent_recipe_ids(user):
+    """Return the set of recipe ids of the user's latest planned weeks.
+
+    Read from User.recent_recipes, so it costs no query once the user is loaded.
+    """
+    return {recipe_id for week in user.recent_recipes for recipe_id in week['recipes']}
+
+
+def remember_recipes(plans):
+    """Record the recipes of new diets in their users' recent_recipes with one query.
+
+    Each user keeps the RECENT_WEEKS weeks with the latest start dates; a new
+    diet replaces the record of a week starting on the same day.
+
+    Args:
+        plans: (Diet, [recipe_id, ...]) pairs whose diets have their user loaded.
+    """
+    from apps.users.models import User
+
+    users = {}
+    for diet, recipe_ids in plans:
+        user = users.setdefault(diet.user_id, diet.user)
+        start = diet.startDate.isoformat()
+        weeks = [week for week in user.recent_recipes if week['start'] != start]
+        weeks.append({'start': start, 'recipes': sorted({r for r in recipe_ids if r is not None})})
+        user.recent_recipes = sorted(weeks, key=lambda week: week['start'])[-RECENT_WEEKS:]
+
+    if users:
+        User.objects.bulk_update(list(users.values()), ['recent_recipes'])
+
+
+def _shuffled(recipe_ids, recent, weights=None):
+    """Shuffle a pool so recent recipes are popped last, only once the others ran out.
+
+    With weights the order is a weighted random permutation: every recipe gets
+    the key u ** (1 / weight) for a uniform u, so heavier recipes tend to sort
+    last and be popped first.
+    """
+    if weights is not None:
+        recipe_ids = np.asarray(recipe_ids)
+        keys = np.random.random(len(recipe_ids)) ** (1 / np.asarray(weights))
+        keys -= np.isin(recipe_ids, list(recent))
+        return recipe_ids[np.argsort(keys)].tolist()
+
+    fresh = [recipe_id for recipe_id in recipe_ids if recipe_id not in recent]
+    seen = [recipe_id for recipe_id in recipe_ids if recipe_id in recent]
+    random.shuffle(fresh)
+    random.shuffle(seen)
+    return seen + fresh
+
+
+def pick_week_recipes(pools, weeks=1, recent=frozenset(), weights=None):
+    """Pick the 21 recipes of a week (breakfast, lunch, dinner for 7 days).
+
+    Each pool is shuffled and consumed without repetition; once a pool runs out
+    it is shuffled again, so every recipe is used before any is repeated, also
+    across the weeks of a longer plan. Slots without any eligible recipe are None.
+
+    Args:
+        pools (dict): {meal: [recipe_id, ...]} as returned by get_eligible_pools.
+        weeks (int): Number of consecutive weeks to pick.
+        recent (set): Recipe ids eaten lately, only used once the rest of their pool is.
+        weights (dict): Optional {meal: weights} aligned with pools; heavier
+            recipes are more likely to come early in each pass over a pool.
+
+    Returns:
+        A flat list of 21 * weeks recipe ids (or None), ordered day by day in MEAL_ORDER.
+    """
+    remaining = {meal: [] for meal in MEAL_ORDER}
+
+    result_recipes = []
+    for _ in range(7 * weeks):
+        for meal in MEAL_ORDER:
+            if not remaining[meal] and pools.get(meal):
+                remaining[meal] = _shuffled(pools[meal], recent, (weights or {}).get(meal))
+            if remaining[meal]:
+                result_recipes.append(remaining[meal].pop())
+            else:
+                result_recipes.append(None)  # Leave empty if no recipe available
+    return result_recipes
+
+
+def generate_week_recipes(user, user_tag_ids, mode=GenerationMode.RANDOM, ingredient_ids=(), weeks=1, favorite_ids=()):
+    """Pick the 21 recipes of a user's week with the requested generation mode.
+
+    Args:
+        user: The user the week is for (its ideal should be loaded).
+        user_tag_ids: Ids of the tags the user wants to avoid.
+        mode (str): A GenerationMode value.
+        ingredient_ids: Ids of the ingredients the user wants to avoid.
+        weeks (int): Number of consecutive weeks to pick. Eligible recipes are
+            resolved once and variety is spread over the whole plan.
+        favorite_ids: Ids of the user's favorite recipes.
+
+    Returns:
+        A flat list of 21 * weeks recipe ids (or None), ordered day by day in MEAL_ORDER.
+    """
+    preferences = {user.pk: (user_tag_ids, ingredient_ids, favorite_ids)}
+    return generate_shared_recipes([user], preferences, mode, weeks)
+
+
+def generate_shared_recipes(members, preferences, mode=GenerationMode.RANDOM, weeks=1):
+    """Pick one set of recipes that every member of a household can eat.
+
+    The tags and ingredients excluded by any member are excluded for all. The
+    goal filter only applies when every member shares the same goal, and the
+    nutrition mode aims at the average daily target of the members. In random
+    mode the favorites of any member weigh FAVORITE_WEIGHT times more.
+
+    Args:
+        members: The users sharing the plan (their ideal should be loaded).
+        preferences (dict): {user_id: (tag_ids, ingredient_ids, favorite_ids)} as
+            returned by user_preferences.
+        mode (str): A GenerationMode value.
+        weeks (int): Number of consecutive weeks to pick.
+
+    Returns:
+        A flat list of 21 * weeks recipe ids (or None), ordered day by day in MEAL_ORDER.
+    """
+    tag_ids, ingredient_ids, favorite_ids = set(), set(), set()
+    for member in members:
+        member_tag_ids, member_ingredient_ids, member_favorite_ids = preferences.get(member.pk, NO_PREFERENCES)
+        tag_ids.update(member_tag_ids)
+        ingredient_ids.update(member_ingredient_ids)
+        favorite_ids.update(member_favorite_ids)
+
+    goals = {member.ideal.goal if member.ideal else None for member in members}
+    goal = goals.pop() if len(goals) == 1 else None
+    # Recipes of the latest weeks are down-weighted, read from the user rows
+    # themselves; favorites are meant to come back often, so they are exempt
+    recent = set().union(*(recent_recipe_ids(member) for member in members)) - favorite_ids
+
+    if mode == GenerationMode.NUTRITION:
+        from apps.diets.optimizer import daily_target, optimize_week
+
+        pools = recipe_index.eligible_nutrients(MEAL_ORDER, tag_ids, goal, ingredient_ids)
+        target = np.mean([daily_target(member) for member in members], axis=0)
+        return optimize_week(pools, target, weeks=weeks, recent=recent)
+
+    pools, weights = weighted_pools(MEAL_ORDER, tag_ids, goal, ingredient_ids, favorite_ids)
+    return pick_week_recipes(pools, weeks, recent, weights)
+
+
+def weighted_pools(meals, tag_ids, goal, ingredient_ids=(), favorite_ids=()):
+    """Eligible recipes of each meal with their weights in random mode.
+
+    Better rated recipes and favorites come up more often: the weights are the
+    smoothed rating averages, FAVORITE_WEIGHT times higher for favorites.
+
+    Returns:
+        A tuple (pools, weights) of dicts {meal: [recipe_id, ...]} and
+        {meal: weights} aligned with the pools.
+    """
+    rated = recipe_index.eligible_ratings(meals, tag_ids, goal, ingredient_ids)
+    pools = {meal: ids.tolist() for meal, (ids, _) in rated.items()}
+    weights = {
+        meal: meal_weights * np.where(np.isin(ids, list(favorite_ids)), FAVORITE_WEIGHT, 1)
+        for meal, (ids, meal_weights) in rated.items()
+    }
+    return pools, weights
+
+
+def create_diets(plans):
+    """Persist diets with their weekly menus using a fixed number of queries.
+
+    Whatever the number of plans, this runs one insert for the diets, one for
+    the menus, one for the menu slots and one update of the users' recent
+    recipes. Callers should wrap it in a transaction.
+
+    Args:
+        plans: List of (diet, recipe_ids) tuples, where diet is an unsaved Diet
+            and recipe_ids is the flat list of 21 ids returned by pick_week_recipes.
+
+    Returns:
+        The list of created diets.
+    """
+    if not plans:
+        return []
+
+    diets = Diet.objects.bulk_create([diet for diet, _ in plans])
+    menus = Menu.objects.bulk_create([
+        Menu(diet=diet, day=day_idx + 1) for diet in diets for day_idx in range(7)
+    ])
+
+    slots = []
+    for plan_idx, (_, recipe_ids) in enumerate(plans):
+        for day_idx in range(7):
+            menu = menus[plan_idx * 7 + day_idx]
+            day_recipes = recipe_ids[day_idx * 3:(day_idx + 1) * 3]
+            for slot, recipe_id in enumerate(day_recipes):
+                if recipe_id is not None:
+                    slots.append(MenuRecipe(menu_id=menu.pk, slot=slot, recipe_id=recipe_id))
+
+    MenuRecipe.objects.bulk_create(slots)
+    remember_recipes(plans)
+    return diets
+
+
+def bulk_create_recipes(items, batch_size=None):
+    """Create recipes and their Recipe.tags rows with one bulk insert each.
+
+    Args:
+        items: Validated recipe dicts; 'tags' holds Tag instances or tag ids.
+        batch_size (int): Optional batch size forwarded to bulk_create.
+
+    Returns:
+        The list of created recipes.
+    """
+    tags = []
+    recipes = []
+    for item in items:
+        item = dict(item)
+        tags.append(dict.fromkeys(getattr(tag, 'pk', tag) for tag in item.pop('tags', [])))
+        recipe = Recipe(**item)
+        # bulk_create does not call save()
+        recipe.sync_nutrients()
+        recipes.append(recipe)
+
+    recipes = Recipe.objects.bulk_create(recipes, batch_size=batch_size)
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+        for recipe, tag_ids in zip(recipes, tags)
+        for tag_id in tag_ids
+    ], batch_size=batch_size)
+
+    sync_recipe_ingredients(recipes, created=True)
+
+    # bulk_create sends neither post_save nor m2m_changed, so rebuild the recipe index
+    transaction.on_commit(recipe_index.invalidate)
+    catalog_changed()
+    return recipes
+
+
+def _by_recipe(values):
+    """Case expression mapping recipe ids to integer values, 0 for any other recipe."""
+    whens = [When(pk=recipe_id, then=Value(value)) for recipe_id, value in values.items()]
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def rate_recipes(user, scores):
+    """Save a user's ratings and fold them into the recipe rating counters.
+
+    A burst of ratings is written as one batch whatever its size: one lock of
+    the user's row, one read of their previous scores, one upsert of the rating
+    rows and one UPDATE of the affected recipes. Counters move by F()
+    expressions, so concurrent batches never overwrite each other's increments,
+    and the user lock serializes two batches of the same user, which would
+    otherwise both count a first rating of the same recipe.
+
+    The catalog version is not bumped: cached catalog pages and the recipe
+    index of other workers keep their rating averages until the next catalog
+    write, which is accepted to keep ratings from flushing every cached page.
+
+    Args:
+        user: The rating user.
+        scores (dict): {recipe_id: score}.
+
+    Returns:
+        A dict {recipe_id: (count delta, sum delta)} of the counter changes.
+    """
+    from apps.users.models import User
+
+    with transaction.atomic():
+        # Lock a row that always exists, the ratings may not exist yet
+        User.objects.select_for_update().only('pk').get(pk=user.pk)
+        previous = dict(
+            Rating.objects.filter(user=user, recipe_id__in=scores).values_list('recipe_id', 'score')
+        )
+        Rating.objects.bulk_create(
+            [Rating(user=user, recipe_id=recipe_id, score=score) for recipe_id, score in scores.items()],
+            update_conflicts=True,
+            unique_fields=['user', 'recipe'],
+            update_fields=['score', 'updated_at'],
+        )
+
+        deltas = {
+            recipe_id: (int(recipe_id not in previous), score - previous.get(recipe_id, 0))
+            for recipe_id, score in scores.items()
+        }
+        deltas = {recipe_id: delta for recipe_id, delta in deltas.items() if delta != (0, 0)}
+        _apply_rating_deltas(deltas)
+    return deltas
+
+
+def forget_ratings(user):
+    """Remove a user's ratings from the recipe rating counters.
+
+    Called before the user is deleted, since the cascade on Rating would
+    leave the counters untouched. Runs one read and one UPDATE.
+    """
+    ratings = Rating.objects.filter(user=user).values_list('recipe_id', 'score')
+    _apply_rating_deltas({recipe_id: (-1, -score) for recipe_id, score in ratings})
+
+
+def _apply_rating_deltas(deltas):
+    """Move the counters of the recipes in deltas, {recipe_id: (count delta, sum delta)}."""
+    if not deltas:
+        return
+    # updated_at moves too, so the sync feed returns the new averages
+    Recipe.objects.filter(pk__in=deltas).update(
+        rating_count=F('rating_count') + _by_recipe({r: d[0] for r, d in deltas.items()}),
+        rating_sum=F('rating_sum') + _by_recipe({r: d[1] for r, d in deltas.items()}),
+        updated_at=timezone.now(),
+    )
+    transaction.on_commit(lambda: recipe_index.add_ratings(deltas))
+
+
+def sync_recipe_ingredients(recipes, created=False):
+    """Rebuild the RecipeIngredient rows of recipes from their ingredients JSON.
+
+    Runs at most four queries whatever the number of recipes: one to clear the
+    old rows (skipped for new recipes), one to insert unseen ingredient names,
+    one to read their ids and one to insert the rows.
+
+    Args:
+        recipes: Saved Recipe instances.
+        created (bool): Whether the recipes were just created.
+
+    Returns:
+        A dict {recipe_id: [ingredient_id, ...]} for every recipe.
+    """
+    parsed = {recipe.pk: parse_ingredients(recipe.ingredients) for recipe in recipes}
+    if not created:
+        RecipeIngredient.objects.filter(recipe_id__in=list(parsed)).delete()
+
+    names = {name for entries in parsed.values() for name, _, _ in entries}
+    if not names:
+        return {recipe_id: [] for recipe_id in parsed}
+
+    Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+    ids = dict(Ingredient.objects.filter(name__in=names).values_list('name', 'id'))
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe_id=recipe_id, ingredient_id=ids[name], quantity=quantity, unit=unit)
+        for recipe_id, entries in parsed.items()
+        for name, quantity, unit in entries
+    ])
+    return {recipe_id: [ids[name] for name, _, _ in entries] for recipe_id, entries in parsed.items()}
+
+
+# ---------- Per-diet cached aggregates ----------
+
+# Every cached per-diet aggregate, invalidated together by invalidate_diet_caches
+DIET_CACHE_KINDS = ['summary', 'shopping_list']
+DIET_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# Keys deleted per cache query, so a popular recipe never sends one huge DELETE
+DIET_CACHE_DELETE_BATCH = 500
+
+
+def diet_cache_key(kind, diet_id):
+    return f'diets:{kind}:{diet_id}'
+
+
+def invalidate_diet_caches(diet_ids):
+    """Drop every cached aggregate of the given diets once the transaction commits.
+
+    Must be called by any write that changes a diet's menus or slots, or the
+    recipes they point to. Only the shared cache configured in settings.CACHES
+    makes the deletion reach every worker (see apps.diets.checks).
+    """
+    keys = [diet_cache_key(kind, diet_id) for diet_id in diet_ids for kind in DIET_CACHE_KINDS]
+
+    def delete():
+        for start in range(0, len(keys), DIET_CACHE_DELETE_BATCH):
+            cache.delete_many(keys[start:start + DIET_CACHE_DELETE_BATCH])
+
+    if keys:
+        transaction.on_commit(delete)
+
+
+def diets_using_recipes(recipe_ids):
+    """Ids of the diets with a menu slot pointing to any of the recipes."""
+    return set(
+        MenuRecipe.objects.filter(recipe_id__in=recipe_ids, menu__diet__isnull=False)
+        .values_list('menu__diet_id', flat=True)
+        .distinct()
+    )
+
+
+def diet_nutrition_summary(diet):
+    """Compute the calories and macros of a diet per day and for the whole week.
+
+    Every total comes from one grouped aggregate query over the typed nutrient
+    columns of the recipes in the diet's menu slots.
+
+    Args:
+        diet: The Diet to summarize.
+
+    Returns:
+        A dict with the diet dates, one entry per day and the week totals. Each
+        entry also counts the recipes without calorie information, whose
+        nutrients are left out of the totals.
+    """
+    rows = (
+        MenuRecipe.objects.filter(menu__diet=diet)
+        .values('menu__day')
+        .annotate(
+            recipes=Count('id'),
+            incomplete=Count('id', filter=Q(recipe__calories__isnull=True)),
+            **{key: Sum(f'recipe__{key}') for key in NUTRIENT_KEYS},
+        )
+        # Replaces the slot ordering of MenuRecipe, which would split the groups
+        .order_by('menu__day')
+    )
+
+    fields = ['recipes', 'incomplete', *NUTRIENT_KEYS]
+    days = []
+    week = dict.fromkeys(fields, 0)
+    for row in rows:
+        day = {'day': row['menu__day']}
+        for field in fields:
+            value = row[field] or 0
+            day[field] = round(value, 1) if field in NUTRIENT_KEYS else value
+            week[field] += value
+        days.append(day)
+
+    return {
+        'diet': diet.pk,
+        'startDate': diet.startDate.isoformat(),
+        'endDate': diet.endDate.isoformat(),
+        'days': days,
+        'week': {field: round(value, 1) for field, value in week.items()},
+    }
+
+
+# Units merged into a common one on the shopping list: {unit: (common unit, factor)}
+UNIT_CONVERSIONS = {
+    'kg': ('g', 1000),
+    'gr': ('g', 1),
+    'mg': ('g', 0.001),
+    'l': ('ml', 1000),
+}
+
+
+def diet_shopping_list(diet):
+    """Build the shopping list of a diet from the ingredients of its menu slots.
+
+    One grouped query sums the quantities of each ingredient and unit over the
+    whole week; a recipe used on several days counts once per slot. Units of
+    the same kind (kg and g, l and ml) are then merged in a single pass.
+
+    Args:
+        diet: The Diet to build the list for.
+
+    Returns:
+        A dict with the diet id and its items sorted by ingredient name. Items
+        without any quantity (e.g. "sal") have a quantity of None.
+    """
+    rows = (
+        RecipeIngredient.objects.filter(recipe__menu_slots__menu__diet=diet)
+        .values('ingredient_id', 'ingredient__name', 'unit')
+        .annotate(quantity=Sum('quantity'), recipes=Count('id'))
+        .order_by('ingredient__name', 'unit')
+    )
+
+    items = {}
+    for row in rows:
+        # Units are free text, "G" and "g" are the same item
+        unit = row['unit'].lower()
+        unit, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+        item = items.setdefault((row['ingredient_id'], unit), {
+            'ingredient': row['ingredient_id'],
+            'name': row['ingredient__name'],
+            'quantity': None,
+            'unit': unit,
+            'recipes': 0,
+        })
+        if row['quantity'] is not None:
+            item['quantity'] = round((item['quantity'] or 0) + row['quantity'] * factor, 2)
+        item['recipes'] += row['recipes']
+
+    return {
+        'diet': diet.pk,
+        'items': sorted(items.values(), key=lambda item: (item['name'], item['unit'])),
+    }
+
+
+def _cached(kind, build, diet):
+    key = diet_cache_key(kind, diet.pk)
+    value = cache.get(key)
+    if value is None:
+        value = build(diet)
+        cache.set(key, value, DIET_CACHE_TIMEOUT)
+    return value
+
+
+def cached_diet_nutrition_summary(diet):
+    """diet_nutrition_summary, cached per diet id until invalidate_diet_caches."""
+    return _cached('summary', diet_nutrition_summary, diet)
+
+
+def cached_diet_shopping_list(diet):
+    """diet_shopping_list, cached per diet id until invalidate_diet_caches."""
+    return _cached('shopping_list', diet_shopping_list, diet)
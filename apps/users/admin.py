@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import User, Progress, Ideal
+from .models import User, Progress, Ideal, Household
 
 admin.site.register(User)
 admin.site.register(Progress)
 admin.site.register(Ideal)
+admin.site.register(Household)
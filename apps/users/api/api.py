@@ -2,15 +2,22 @@ from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from rest_framework.authtoken.models import Token
 
 from apps.diets.models import Diet
-from apps.diets.api.serializers import DietDetailedSerializer
-from apps.users.models import User
+from apps.diets.api.serializers import DietDetailedSerializer, RecipeSerializer
+from apps.diets.api.pagination import DietCursorPagination
+from apps.users.models import User, Household
 
-from .serializers import ComparisonSerializer, ProgressSerializer, UserSerializer, LoginSerializer, AdminUserSerializer, ChangePasswordSerializer
+from .serializers import ComparisonSerializer, ProgressSerializer, UserSerializer, LoginSerializer, AdminUserSerializer, ChangePasswordSerializer, HouseholdSerializer, FavoriteRecipesSerializer
 from rest_framework.exceptions import PermissionDenied
 from django.views.generic import TemplateView
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+import json
+import csv
 
 
 class UserCreateAPIView(generics.CreateAPIView):
@@ -266,33 +273,142 @@ class ComparisonAPIView(generics.GenericAPIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class GetHistoricalApiView(generics.ListAPIView):
-    """API view to retrieve all diets related to the authenticated user's historical.
+class HouseholdListCreateAPIView(generics.ListCreateAPIView):
+    """List the requesting user's households or create a new one.
+
+    Request body (POST): {
+        "name": str,
+        "invite": [email, ...]
+    }
+
+    The requesting user is the only member of the households they create; the
+    invited users join by accepting the invitation, and members leave or remove
+    each other with HouseholdMemberDeleteAPIView. Their linked diets are
+    generated by the diets household plan endpoint.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = HouseholdSerializer
+
+    def get_queryset(self):
+        return self.request.user.households.prefetch_related('members')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class HouseholdInvitationListAPIView(generics.ListAPIView):
+    """List the households the requesting user is invited to."""
+    permission_classes = [IsAuthenticated]
+    serializer_class = HouseholdSerializer
+
+    def get_queryset(self):
+        return self.request.user.household_invitations.prefetch_related('members')
+
+
+class HouseholdInvitationAPIView(generics.GenericAPIView):
+    """Accept or decline an invitation to a household.
+
+    POST: Join the household.
+    DELETE: Decline the invitation.
+
+    Response (POST): The household, 200
+    Response (DELETE): 204 No Content
+    Response: 404 when the requesting user is not invited to the household
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = HouseholdSerializer
+
+    def get_object(self):
+        return get_object_or_404(Household, pk=self.kwargs['pk'], invited=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        household = self.get_object()
+        with transaction.atomic():
+            household.invited.remove(request.user)
+            household.members.add(request.user)
+        return Response(self.get_serializer(household).data, status=status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        self.get_object().invited.remove(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class HouseholdMemberDeleteAPIView(generics.GenericAPIView):
+    """Leave a household, or remove another member from it.
+
+    DELETE: Requires being a member of the household. The removed user's
+    household diets that have not started yet are deleted, so they no longer
+    block the user's own plans; a household left without members is deleted.
+
+    Response (DELETE): 204 No Content
+    Response: 404 when the requesting user or the removed user is not a member
+    """
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, pk, user_id, *args, **kwargs):
+        from django.utils import timezone
+
+        household = get_object_or_404(Household, pk=pk, members=request.user)
+        member = get_object_or_404(household.members.all(), pk=user_id)
+        with transaction.atomic():
+            household.members.remove(member)
+            Diet.objects.filter(household=household, user=member, startDate__gt=timezone.now().date()).delete()
+            if not household.members.exists():
+                household.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FavoriteRecipesAPIView(generics.ListCreateAPIView):
+    """List or add the authenticated user's favorite recipes.
+
+    Favorites come up more often in the user's generated diets.
+
+    GET: The favorite recipes, in id order.
+    POST: Add recipes to the favorites; recipes already pinned are kept.
+
+    Request body (POST): { "recipes": [recipe_id, ...] }
+    Response (POST): { "recipes": [recipe_id, ...] } the added ids
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_serializer_class(self):
+        return RecipeSerializer if self.request.method == 'GET' else FavoriteRecipesSerializer
+
+    def get_queryset(self):
+        return self.request.user.favorite_recipes.prefetch_related('tags').order_by('id')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        request.user.favorite_recipes.add(*serializer.validated_data['recipes'])
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class FavoriteRecipeDeleteAPIView(generics.GenericAPIView):
+    """Remove a recipe from the authenticated user's favorites.
+
+    Response (DELETE): 204 No Content, also when the recipe was not a favorite
+    """
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, recipe_id, *args, **kwargs):
+        request.user.favorite_recipes.remove(recipe_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DietHistoryQuerysetMixin:
+    """Diets of the authenticated user, with their menus prefetched.
 
-    GET: Retrieve all diets for the authenticated user.
-    
     Optional query parameters:
     - start_date: Filter diets starting from this date (YYYY-MM-DD format)
     - end_date: Filter diets up to this date (YYYY-MM-DD format)
-
-    Response (GET): [
-        {
-            "id": 1,
-            "startDate": "YYYY-MM-DD",
-            "endDate": "YYYY-MM-DD",
-            "menus": [...]
-        },
-        ...
-    ]
     """
-    permission_classes = [IsAuthenticated]
-    serializer_class = DietDetailedSerializer
 
     def get_queryset(self):
         from datetime import datetime
         
         user = self.request.user
-        diets = Diet.objects.filter(user=user)
+        diets = Diet.objects.filter(user=user).with_menus()
         
         # Apply date range filters if provided
         start_date = self.request.query_params.get('start_date')
@@ -315,6 +431,99 @@ class GetHistoricalApiView(generics.ListAPIView):
         return diets
 
 
+class GetHistoricalApiView(DietHistoryQuerysetMixin, generics.ListAPIView):
+    """API view to retrieve all diets related to the authenticated user's historical.
+
+    GET: Retrieve the diets of the authenticated user, newest first, one page at a time.
+    Menus and recipes are prefetched, so the number of queries does not depend on
+    the number of diets.
+    
+    Optional query parameters:
+    - start_date: Filter diets starting from this date (YYYY-MM-DD format)
+    - end_date: Filter diets up to this date (YYYY-MM-DD format)
+    - page_size: Diets per page (default 10, max 50)
+    - cursor: Opaque cursor taken from the "next" or "previous" links
+
+    Response (GET): {
+        "next": "<url or null>",
+        "previous": "<url or null>",
+        "results": [
+            {
+                "startDate": "YYYY-MM-DD",
+                "endDate": "YYYY-MM-DD",
+                "menus": [...]
+            },
+            ...
+        ]
+    }
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = DietDetailedSerializer
+    pagination_class = DietCursorPagination
+
+
+class HistoricalExportAPIView(DietHistoryQuerysetMixin, generics.GenericAPIView):
+    """API view to download the whole diet history of the authenticated user.
+
+    GET: Stream every diet with its menus and recipes, oldest first. Diets are read
+    from the database in chunks and written as they are read, so memory use does not
+    depend on the length of the history.
+
+    Optional query parameters:
+    - file_format: "ndjson" (default, one diet per line) or "csv" (one recipe per row)
+    - start_date / end_date: Same filters as the historical endpoint
+
+    Response (GET): 200 with a streamed attachment, 400 for an unknown file_format
+    """
+    permission_classes = [IsAuthenticated]
+
+    CHUNK_SIZE = 100
+    CSV_HEADER = ['startDate', 'endDate', 'day', 'slot', 'name', 'description', 'ingredients', 'preparation_steps']
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in ('ndjson', 'csv'):
+            return Response({'detail': 'Formato no soportado. Use ndjson o csv.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # iterator() with a chunk size keeps the prefetch plan, one chunk at a time
+        diets = self.get_queryset().order_by('startDate', 'id').iterator(chunk_size=self.CHUNK_SIZE)
+
+        if file_format == 'csv':
+            rows, content_type = self._csv_rows(diets), 'text/csv'
+        else:
+            rows, content_type = self._ndjson_lines(diets), 'application/x-ndjson'
+
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="diets.{file_format}"'
+        return response
+
+    def _ndjson_lines(self, diets):
+        for diet in diets:
+            yield json.dumps(DietDetailedSerializer(diet).data, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+    def _csv_rows(self, diets):
+        class Echo:
+            """File-like object that hands back what csv.writer writes."""
+            def write(self, value):
+                return value
+
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.CSV_HEADER)
+        for diet in diets:
+            for menu in diet.menus.all():
+                for slot in menu.slots.all():
+                    yield writer.writerow([
+                        diet.startDate,
+                        diet.endDate,
+                        menu.day,
+                        slot.slot,
+                        slot.recipe.name,
+                        slot.recipe.description,
+                        json.dumps(slot.recipe.ingredients, ensure_ascii=False),
+                        slot.recipe.preparation_steps,
+                    ])
+
+
 class UnsubscribeByCredentialsAPIView(generics.GenericAPIView):
     """Public API endpoint that unsubscribes a user when they provide email + password.
 
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from apps.users.models import User, Ideal, Progress
-from apps.diets.models import Tag
+from apps.users.models import User, Ideal, Progress, Household
+from apps.diets.models import Tag, Ingredient
+from apps.diets.api.serializers import check_recipes
 from Nutrimate.core.enums import Goal
 
 
@@ -38,6 +39,11 @@ class UserSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
         required=False
     )
+    excluded_ingredients = serializers.PrimaryKeyRelatedField(
+        many=True,
+        queryset=Ingredient.objects.all(),
+        required=False
+    )
     progress = serializers.PrimaryKeyRelatedField(
         required=False,
         allow_null=True,
@@ -98,6 +104,7 @@ class UserSerializer(serializers.ModelSerializer):
             'date_joined',
             'progress',
             'tags',
+            'excluded_ingredients',
             'ideal',
             'email_opt_out',
             'is_staff',
@@ -146,6 +153,46 @@ class ComparisonSerializer(serializers.Serializer):
     bmi = serializers.FloatField()
 
 
+class HouseholdSerializer(serializers.ModelSerializer):
+    """Create a household and invite users to it by email.
+
+    The requesting user is the only member until the invited users accept.
+    Emails without an account are ignored the same way as the others, so the
+    response never tells which emails are registered.
+    """
+    members = serializers.SlugRelatedField(many=True, slug_field='email', read_only=True)
+    invite = serializers.ListField(child=serializers.EmailField(), write_only=True, required=False)
+
+    def create(self, validated_data):
+        user = validated_data.pop('user')
+        emails = validated_data.pop('invite', [])
+        household = Household.objects.create(**validated_data)
+        household.members.set([user])
+        household.invited.set(User.objects.filter(email__in=emails).exclude(pk=user.pk))
+        return household
+
+    class Meta:
+        model = Household
+        fields = [
+            'id',
+            'name',
+            'members',
+            'invite',
+            'created_at'
+        ]
+        read_only_fields = ['id', 'created_at']
+
+
+class FavoriteRecipesSerializer(serializers.Serializer):
+    """Recipe ids to pin as favorites of the requesting user."""
+    recipes = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+    def validate(self, data):
+        check_recipes(data['recipes'], field='recipes')
+        data['recipes'] = sorted(set(data['recipes']))
+        return data
+
+
 class ChangePasswordSerializer(serializers.Serializer):
     """Serializer to validate old password and new password for authenticated users."""
     old_password = serializers.CharField(write_only=True, required=True, min_length=4)
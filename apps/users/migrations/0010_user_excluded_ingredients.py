@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0016_backfill_recipe_ingredients"),
+        ("users", "0009_alter_user_ideal"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="excluded_ingredients",
+            field=models.ManyToManyField(
+                blank=True,
+                help_text="Ingredientes que el usuario no quiere en sus dietas",
+                related_name="excluded_by",
+                to="diets.ingredient",
+            ),
+        ),
+    ]
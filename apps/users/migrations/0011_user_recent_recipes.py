@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_user_excluded_ingredients"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="recent_recipes",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="Recetas de las últimas semanas planificadas, para variar las siguientes",
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_user_recent_recipes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Household",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "members",
+                    models.ManyToManyField(
+                        related_name="households", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diets", "0020_recipe_ratings"),
+        ("users", "0012_household"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="favorite_recipes",
+            field=models.ManyToManyField(
+                blank=True,
+                help_text="Recetas que el usuario quiere ver más a menudo en sus dietas",
+                related_name="favorited_by",
+                to="diets.recipe",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 10:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0013_user_favorite_recipes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="household",
+            name="invited",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="household_invitations",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
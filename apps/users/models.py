@@ -39,6 +39,20 @@ class User(AbstractBaseUser, PermissionsMixin):
         related_name='users',
         blank=True,
     )
+
+    excluded_ingredients = models.ManyToManyField(
+        'diets.Ingredient',
+        related_name='excluded_by',
+        blank=True,
+        help_text='Ingredientes que el usuario no quiere en sus dietas'
+    )
+
+    favorite_recipes = models.ManyToManyField(
+        'diets.Recipe',
+        related_name='favorited_by',
+        blank=True,
+        help_text='Recetas que el usuario quiere ver más a menudo en sus dietas'
+    )
     
     ideal = models.OneToOneField(
         'Ideal',
@@ -51,6 +65,14 @@ class User(AbstractBaseUser, PermissionsMixin):
         help_text='Si es True, el usuario no recibirá notificaciones por email'
     )
 
+    # [{"start": "YYYY-MM-DD", "recipes": [recipe_id, ...]}, ...] for the latest
+    # planned weeks, maintained by apps.diets.utils.create_diets
+    recent_recipes = models.JSONField(
+        default=list,
+        blank=True,
+        help_text='Recetas de las últimas semanas planificadas, para variar las siguientes'
+    )
+
     # Flags required by Django auth for admin/staff permissions
     is_staff = models.BooleanField(
         'staff status',
@@ -83,6 +105,27 @@ class Progress(models.Model):
     def __str__(self):
         return f"Progress recorded on {self.last_updated} with a BMI of {self.bmi}"
 
+class Household(models.Model):
+    """Users sharing the same meals, planned together by the household diet mode.
+
+    Users only join a household by accepting an invitation, since any member
+    can generate diets into the accounts of the others.
+    """
+    name = models.CharField(max_length=100)
+    members = models.ManyToManyField(
+        'User',
+        related_name='households',
+    )
+    invited = models.ManyToManyField(
+        'User',
+        related_name='household_invitations',
+        blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
 class Ideal(models.Model):
     goal = models.CharField(
         max_length=1,
@@ -182,3 +182,96 @@ class UsersBusinessLogicTests(TestCase):
 		self.assertAlmostEqual(data['difference'], abs(ideal.ideal_weight - progress.current_weight))
 		self.assertEqual(data['achieved_goal'], False)
 		self.assertAlmostEqual(data['bmi'], progress.bmi)
+
+
+class HistoricalDietsTests(TestCase):
+	"""Tests for the paginated diet history endpoint."""
+
+	def setUp(self):
+		from apps.users.models import Ideal
+
+		self.user = User.objects.create_user(
+			email='history@example.com', password='pw12', first_name='H', last_name='U',
+			age=30, height=170, weight=70, ideal=Ideal.objects.create(goal='N')
+		)
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+
+	def create_diets(self, count):
+		from datetime import date, timedelta
+		from apps.diets.models import Diet, Menu, MenuRecipe, Recipe
+
+		recipes = [
+			Recipe.objects.create(name=f'R{meal}', description='x', ingredients=[], preparation_steps='x', nutritional_info={}, meal=meal, goal='N')
+			for meal in ('B', 'L', 'D')
+		]
+		start = date(2025, 1, 6) + timedelta(days=7 * Diet.objects.count())
+		for week in range(count):
+			diet_start = start + timedelta(days=7 * week)
+			diet = Diet.objects.create(user=self.user, startDate=diet_start, endDate=diet_start + timedelta(days=7))
+			for day in range(1, 8):
+				menu = Menu.objects.create(diet=diet, day=day)
+				for slot, recipe in enumerate(recipes):
+					MenuRecipe.objects.create(menu=menu, slot=slot, recipe=recipe)
+
+    # ---------- TEST CASES ----------
+
+	def test_historical_query_count_does_not_grow_with_history(self):
+		url = reverse('historical-diets')
+
+		self.create_diets(2)
+		# diets page, menus, menu slots with their recipes
+		with self.assertNumQueries(3):
+			res = self.client.get(url)
+		self.assertEqual(len(res.data['results']), 2)
+
+		self.create_diets(4)
+		with self.assertNumQueries(3):
+			res = self.client.get(url)
+		self.assertEqual(len(res.data['results']), 6)
+		menu = res.data['results'][0]['menus'][0]
+		self.assertEqual([recipe['name'] for recipe in menu['recipes']], ['RB', 'RL', 'RD'])
+
+	def test_historical_is_cursor_paginated_newest_first(self):
+		url = reverse('historical-diets')
+		self.create_diets(5)
+
+		res = self.client.get(url, {'page_size': 2})
+		self.assertEqual(res.status_code, 200)
+		first_page = [diet['startDate'] for diet in res.data['results']]
+		self.assertEqual(first_page, sorted(first_page, reverse=True))
+		self.assertIsNotNone(res.data['next'])
+
+		seen = list(first_page)
+		while res.data['next']:
+			res = self.client.get(res.data['next'])
+			seen.extend(diet['startDate'] for diet in res.data['results'])
+		self.assertEqual(len(seen), 5)
+		self.assertEqual(seen, sorted(seen, reverse=True))
+
+	def test_export_streams_ndjson_and_csv_with_date_filters(self):
+		import csv
+		import io
+		import json
+
+		url = reverse('historical-export')
+		self.create_diets(3)
+
+		res = self.client.get(url)
+		self.assertEqual(res.status_code, 200)
+		self.assertTrue(res.streaming)
+		lines = b''.join(res.streaming_content).decode().splitlines()
+		diets = [json.loads(line) for line in lines]
+		self.assertEqual([diet['startDate'] for diet in diets], ['2025-01-06', '2025-01-13', '2025-01-20'])
+		self.assertEqual(len(diets[0]['menus']), 7)
+
+		res = self.client.get(url, {'file_format': 'csv', 'start_date': '2025-01-13'})
+		self.assertEqual(res['Content-Type'], 'text/csv')
+		rows = list(csv.reader(io.StringIO(b''.join(res.streaming_content).decode())))
+		self.assertEqual(rows[0][:4], ['startDate', 'endDate', 'day', 'slot'])
+		# two diets x 7 days x 3 meals
+		self.assertEqual(len(rows) - 1, 42)
+		self.assertEqual(rows[1][4], 'RB')
+
+		res = self.client.get(url, {'file_format': 'xml'})
+		self.assertEqual(res.status_code, 400)
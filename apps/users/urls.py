@@ -2,8 +2,9 @@ from django.urls import path
 from .api.api import (
     ProgressCreateAPIView, ProgressPatchAPIView, UserCreateAPIView, AdminCreateAPIView,
     UserListAPIView, UserLoginAPIView, UserLogoutAPIView, ChangePasswordAPIView,
-    ComparisonAPIView, GetHistoricalApiView, UnsubscribeByCredentialsAPIView,
-    UnsubscribeFormView
+    ComparisonAPIView, GetHistoricalApiView, HistoricalExportAPIView, UnsubscribeByCredentialsAPIView,
+    UnsubscribeFormView, HouseholdListCreateAPIView, HouseholdInvitationListAPIView, HouseholdInvitationAPIView,
+    HouseholdMemberDeleteAPIView, FavoriteRecipesAPIView, FavoriteRecipeDeleteAPIView
 )
 
 
@@ -17,7 +18,14 @@ urlpatterns = [
     path('progress/patch/', ProgressPatchAPIView.as_view(), name='progress-patch'),
     path('comparison/', ComparisonAPIView.as_view(), name='comparison'),
     path('historical/', GetHistoricalApiView.as_view(), name='historical-diets'),
+    path('historical/export/', HistoricalExportAPIView.as_view(), name='historical-export'),
     path('unsubscribe/form/', UnsubscribeFormView.as_view(), name='unsubscribe-form'),
     path('unsubscribe-by-credentials/', UnsubscribeByCredentialsAPIView.as_view(), name='unsubscribe-by-credentials'),
+    path('households/', HouseholdListCreateAPIView.as_view(), name='household-list-create'),
+    path('households/invitations/', HouseholdInvitationListAPIView.as_view(), name='household-invitation-list'),
+    path('households/<int:pk>/invitation/', HouseholdInvitationAPIView.as_view(), name='household-invitation'),
+    path('households/<int:pk>/members/<int:user_id>/', HouseholdMemberDeleteAPIView.as_view(), name='household-member-delete'),
+    path('favorites/', FavoriteRecipesAPIView.as_view(), name='favorite-recipes'),
+    path('favorites/<int:recipe_id>/', FavoriteRecipeDeleteAPIView.as_view(), name='favorite-recipe-delete'),
     path('get-users/', UserListAPIView.as_view(), name='user-get'),
 ]